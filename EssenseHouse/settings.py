@@ -54,6 +54,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
     'backend',
@@ -76,7 +77,22 @@ CHANNEL_LAYERS = {
     },
 }
 
+# JSON через orjson (backend.renderers); False — стандартные рендерер и парсер DRF
+FAST_JSON_ENABLED = True
+
+JSON_RENDERER_CLASS = 'backend.renderers.FastJSONRenderer' if FAST_JSON_ENABLED else 'rest_framework.renderers.JSONRenderer'
+JSON_PARSER_CLASS = 'backend.renderers.FastJSONParser' if FAST_JSON_ENABLED else 'rest_framework.parsers.JSONParser'
+
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': (
+        JSON_RENDERER_CLASS,
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        JSON_PARSER_CLASS,
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
     ),
@@ -105,6 +121,7 @@ INTERNAL_IPS = [
 MIDDLEWARE = [
     # 'debug_toolbar.middleware.DebugToolbarMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'backend.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -289,4 +306,46 @@ CACHES = {
          "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
          "LOCATION": "unique-snowflake",
     }
-}
\ No newline at end of file
+}
+
+# С Redis кэш становится двухуровневым: LRU в памяти воркера перед общим Redis,
+# а записи и инвалидации рассылаются остальным воркерам через pub/sub.
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'backend.cache_backends.TieredCache',
+            'LOCATION': 'shared',
+            'OPTIONS': {
+                'BROADCAST_URL': REDIS_URL,
+                'L1_MAX_ENTRIES': 1000,
+                'L1_TIMEOUT': 5,
+            },
+        },
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+
+# Индекс каталога в памяти процесса (NumPy) для фильтрации и сортировки без запросов к БД.
+# Изменения из других воркеров подхватываются перезагрузкой не реже раза в CATALOG_INDEX_MAX_AGE секунд.
+CATALOG_INDEX_ENABLED = False
+CATALOG_INDEX_MAX_AGE = 300
+
+
+# Денормализованные карточки домов (HouseCard) для списков каталога: чтение одним запросом к одной таблице.
+# Перед включением заполните таблицу: python manage.py rebuild_house_cards
+HOUSE_CARDS_ENABLED = False
+
+
+# Уменьшенные копии загруженных изображений (WebP и JPEG нескольких ширин) строятся в фоновом пуле потоков
+IMAGE_VARIANTS_ENABLED = True
+IMAGE_VARIANT_WORKERS = 2
+
+# Уменьшение изображений из MEDIA_ROOT по запросу: /media-resize/<w>x<h>/<path>.
+# Готовые копии хранятся в дисковом кэше с вытеснением давно не запрошенных (LRU) сверх лимита размера.
+MEDIA_RESIZE_CACHE_DIR = os.path.join(BASE_DIR, 'media_resize_cache')
+MEDIA_RESIZE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+MEDIA_RESIZE_MAX_SIZE = 2560
@@ -2,8 +2,8 @@
 from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
-from django.views.decorators.cache import cache_page
 
+from backend.media_resize import media_resize
 from backend.views import HouseListView, HouseDetailView, ConstructionTechnologyListView, \
     ConstructionTechnologyDetailView, HouseCategoryListView, HouseCategoryDetailView, \
     FinishingOptionListView, FinishingOptionDetailView, DocumentListView, DocumentDetailView, ReviewsListView, \
@@ -13,15 +13,18 @@ from backend.views import HouseListView, HouseDetailView, ConstructionTechnology
     HouseCategoryDetailByIdView, FilterOptionDetailView, CreateHouseAPIView, UpdateHouseAPIView, DeleteImageView, \
     export_orders_to_excel, export_purchased_houses, export_user_questions_and_houses, DeleteDocumentView, \
     BlogListCreateView, BlogDetailView, BlogCategoryListView, BlogsByCategoryView, OrdersByEmailView, MyQuestionsView, \
-    MyOrdersView, DashboardStatsView
+    MyOrdersView, DashboardStatsView, HouseFacetsView, HouseSuggestView, HouseBatchView
 
 urlpatterns = [
     path('houses/', HouseListView.as_view(), name='house_list'),
     path('houses/<int:pk>/', HouseDetailView.as_view(), name='house_detail'),
+    path('houses/batch/', HouseBatchView.as_view(), name='house_batch'),
     path('houses/filter/', FilteredHouseListView.as_view(), name='filtered-house-list'),
+    path('houses/facets/', HouseFacetsView.as_view(), name='house_facets'),
+    path('houses/suggest/', HouseSuggestView.as_view(), name='house_suggest'),
 
-    path('houses/construction-technologies', cache_page(60 * 15)(ConstructionTechnologyListView.as_view()), name='construction_technology_list'),
-    path('houses/construction-technologies/<int:pk>', cache_page(60 * 15)(ConstructionTechnologyDetailView.as_view()), name='construction_technology_list'),
+    path('houses/construction-technologies', ConstructionTechnologyListView.as_view(), name='construction_technology_list'),
+    path('houses/construction-technologies/<int:pk>', ConstructionTechnologyDetailView.as_view(), name='construction_technology_list'),
     path('houses/category/', HouseCategoryListView.as_view(), name='category_list'),
     path('houses/categories/<slug:slug>/', HouseCategoryDetailView.as_view(), name='house_by_category'),
     path('houses/category/<int:pk>/', HouseCategoryDetailByIdView.as_view(), name='house_by_category'),
@@ -31,7 +34,7 @@ urlpatterns = [
     path('house/documents/<int:pk>/', DocumentDetailView.as_view(), name='document_detail'),
 
     path('filter-options/', FilterOptionListView.as_view(), name='finishing-option-list'),
-    path('filter-options/<int:pk>/', cache_page(60 * 15)(FilterOptionDetailView.as_view()), name='finishing-option-detail'),
+    path('filter-options/<int:pk>/', FilterOptionDetailView.as_view(), name='finishing-option-detail'),
 
     path('purchase/', PurchaseHouseListView.as_view(), name='purchase_house_list'),
     path('purchase/<int:pk>/', PurchaseHouseDetailView.as_view(), name='purchase_house_detail'),
@@ -70,6 +73,8 @@ urlpatterns = [
 
     path('stats/dashboard/', DashboardStatsView.as_view(), name='dashboard_stats'),
 
+    path('media-resize/<int:width>x<int:height>/<path:path>', media_resize, name='media_resize'),
+
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
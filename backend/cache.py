@@ -0,0 +1,437 @@
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from rest_framework.response import Response
+
+from .compression import accepted_encoding, compress_variants
+from .renderers import get_json_renderer
+from .utils import make_cache_key
+
+
+DEFAULT_TIMEOUT = 60 * 60
+
+# Сколько устаревшая запись хранится после своего срока, чтобы отдавать её во время пересборки
+STALE_TIMEOUT = 60 * 5
+# Блокировка пересборки и ожидание её результата теми, кому нечего отдать
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 5
+LOCK_POLL_INTERVAL = 0.05
+# Коэффициент вероятностного раннего обновления (XFetch), 1 — рекомендуемое значение
+EARLY_REFRESH_BETA = 1.0
+# Как часто счётчики попаданий процесса сбрасываются в общий кэш, секунды
+STATS_FLUSH_INTERVAL = 10
+
+# Теги кэша:
+#   house:{id}        — данные одного дома
+#   category:{id}     — страницы категории и дома этой категории (в них вложены данные категории)
+#   catalog           — списки и фасеты каталога, зависят от любого дома
+#   categories        — список категорий
+#   house_references  — технологии, отделка, документы и изображения внутри данных дома
+#   purchase:{id}     — купленный дом
+#   filter_options    — набор фильтров каталога
+#   blog              — статьи блога и их категории
+
+_missing = object()
+
+
+def tag_key(tag):
+    return f"cache_tag_{tag}"
+
+
+def get_tag_versions(tags):
+    """
+    Текущие версии тегов {тег: версия}. Тег без версии получает её при первом обращении.
+    Версия — время в наносекундах, поэтому после вытеснения из кэша значения не повторяются.
+    """
+    keys = {tag_key(tag): tag for tag in tags}
+    versions = {keys[key]: version for key, version in cache.get_many(keys).items()}
+
+    for key, tag in keys.items():
+        if tag not in versions:
+            version = time.time_ns()
+            cache.add(key, version, timeout=None)
+            versions[tag] = cache.get(key, version)
+    return versions
+
+
+def bump_tags(tags):
+    version = time.time_ns()
+    cache.set_many({tag_key(tag): version for tag in tags}, timeout=None)
+
+
+def invalidate_tags(*tags):
+    """
+    Делает недействительными все записи с этими тегами без перебора ключей.
+    Версии меняются сразу и ещё раз после коммита, чтобы не закрепились данные,
+    прочитанные параллельным запросом до фиксации транзакции.
+    """
+    tags = [tag for tag in tags if tag]
+    if not tags:
+        return
+    bump_tags(tags)
+    transaction.on_commit(lambda: bump_tags(tags))
+
+
+def house_cache_tags(house):
+    return (f"house:{house.pk}", f"category:{house.category_id}", 'house_references')
+
+
+FRESH, STALE = 'fresh', 'stale'
+
+
+def lookup(key, tags=()):
+    """
+    Запись по ключу и её состояние: (значение, FRESH), (значение, STALE) или (_missing, None).
+    STALE — теги записи инвалидированы, срок истёк или наступило вероятностное раннее обновление;
+    такое значение ещё можно отдать, пока другой процесс его пересобирает.
+    """
+    values = cache.get_many([key, *(tag_key(tag) for tag in tags)])
+    entry = values.get(key)
+    if not is_entry(entry):
+        return _missing, None
+
+    unknown = [tag for tag in entry[0] if tag_key(tag) not in values]
+    if unknown:
+        values.update(cache.get_many([tag_key(tag) for tag in unknown]))
+    return entry_state(entry, values)
+
+
+def lookup_many(keys):
+    """
+    Состояния записей {ключ: (значение, состояние)} как у lookup, но для многих ключей:
+    записи читаются одним get_many, версии всех их тегов — вторым. Отсутствующих ключей в ответе нет.
+    """
+    entries = {key: entry for key, entry in cache.get_many(keys).items() if is_entry(entry)}
+    tags = {tag for entry in entries.values() for tag in entry[0]}
+    values = cache.get_many([tag_key(tag) for tag in tags]) if tags else {}
+    return {key: entry_state(entry, values) for key, entry in entries.items()}
+
+
+def is_entry(entry):
+    return isinstance(entry, tuple) and len(entry) == 4
+
+
+def entry_state(entry, tag_values):
+    versions, value, expires_at, delta = entry
+    for tag, version in versions.items():
+        if tag_values.get(tag_key(tag)) != version:
+            return value, STALE
+
+    # XFetch: чем ближе конец срока и чем дольше сборка, тем вероятнее обновление заранее
+    if expires_at is not None and time.time() - delta * EARLY_REFRESH_BETA * math.log(1 - random.random()) >= expires_at:
+        return value, STALE
+    return value, FRESH
+
+
+def get_cached(key, tags=(), default=None):
+    """
+    Значение по ключу, если ни один из тегов записи не менялся после её сохранения.
+    Теги, известные заранее, читаются вместе с записью одним get_many.
+    """
+    value, state = lookup(key, tags)
+    return value if state == FRESH else default
+
+
+def set_cached(key, value, tags=(), timeout=DEFAULT_TIMEOUT, versions=None, delta=0):
+    """
+    Сохраняет значение вместе с версиями тегов.
+    versions стоит снять до чтения данных из БД, тогда запись,
+    случившаяся во время построения значения, не потеряется.
+    Запись живёт в кэше дольше своего срока на STALE_TIMEOUT, чтобы её можно было отдать устаревшей.
+    """
+    set_many_cached({key: (value, tags)}, timeout, versions, delta)
+
+
+def set_many_cached(entries, timeout=DEFAULT_TIMEOUT, versions=None, delta=0):
+    """То же, что set_cached, для {ключ: (значение, теги)} одним set_many."""
+    versions = dict(versions or {})
+    missing = {tag for _, tags in entries.values() for tag in tags if tag not in versions}
+    if missing:
+        versions.update(get_tag_versions(missing))
+
+    expires_at = None if timeout is None else time.time() + timeout
+    cache.set_many(
+        {key: ({tag: versions[tag] for tag in tags}, value, expires_at, delta) for key, (value, tags) in entries.items()},
+        timeout=None if timeout is None else timeout + STALE_TIMEOUT,
+    )
+
+
+class Tagged:
+    """
+    Результат build(), теги и срок которого известны только после чтения из БД,
+    например категория дома или короткий срок для записи «не найдено».
+    Версии тегов, переданных в cached(), всё равно снимаются до сборки.
+    """
+
+    def __init__(self, value, tags, timeout=DEFAULT_TIMEOUT):
+        self.value, self.tags, self.timeout = value, tuple(tags), timeout
+
+
+def build_and_set(key, build, tags=(), timeout=DEFAULT_TIMEOUT):
+    versions = get_tag_versions(tags)
+    started = time.monotonic()
+    value = build()
+    if isinstance(value, Tagged):
+        value, tags, timeout = value.value, value.tags, value.timeout
+    set_cached(key, value, tags, timeout, versions, delta=time.monotonic() - started)
+    return value
+
+
+class CacheStats:
+    """
+    Счётчики попаданий (hit), устаревших ответов (stale) и промахов (miss) по имени кэша.
+    Копятся в памяти процесса и раз в STATS_FLUSH_INTERVAL прибавляются к общим счётчикам в кэше,
+    поэтому видны сразу по всем воркерам и не стоят запроса к кэшу на каждый ответ.
+    """
+    OUTCOMES = ('hit', 'stale', 'miss')
+    names_key = 'cache_stats_names'
+
+    def __init__(self):
+        self.pending = Counter()
+        self.flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def counter_key(name, outcome):
+        return f"cache_stats_{name}_{outcome}"
+
+    def record(self, name, outcome):
+        with self._lock:
+            self.pending[name, outcome] += 1
+            due = time.monotonic() - self.flushed_at >= STATS_FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self.pending = self.pending, Counter()
+            self.flushed_at = time.monotonic()
+        if not pending:
+            return
+
+        names = {name for name, _ in pending}
+        known = cache.get(self.names_key, set())
+        if not names <= known:
+            cache.set(self.names_key, known | names, timeout=None)
+        for (name, outcome), count in pending.items():
+            key = self.counter_key(name, outcome)
+            cache.add(key, 0, timeout=None)
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                cache.set(key, count, timeout=None)
+
+    def snapshot(self):
+        """{имя: {'hit': n, 'stale': n, 'miss': n, 'hit_rate': доля}} по всем процессам."""
+        self.flush()
+        names = sorted(cache.get(self.names_key, set()))
+        keys = [self.counter_key(name, outcome) for name in names for outcome in self.OUTCOMES]
+        values = cache.get_many(keys)
+
+        stats = {}
+        for name in names:
+            counts = {outcome: values.get(self.counter_key(name, outcome), 0) for outcome in self.OUTCOMES}
+            total = sum(counts.values())
+            counts['hit_rate'] = (counts['hit'] + counts['stale']) / total if total else None
+            stats[name] = counts
+        return stats
+
+    def reset(self):
+        with self._lock:
+            self.pending.clear()
+        names = cache.get(self.names_key, set())
+        cache.delete_many([self.counter_key(name, outcome) for name in names for outcome in self.OUTCOMES])
+        cache.delete(self.names_key)
+
+
+cache_stats = CacheStats()
+
+
+def cached(key, build, tags=(), timeout=DEFAULT_TIMEOUT, name=None):
+    """
+    Значение из кэша или build() с защитой от лавины пересборок.
+    Пересобирает только тот, кто взял короткую блокировку; остальные получают устаревшее
+    значение, а если его нет — ждут готового до LOCK_WAIT секунд и только потом собирают сами.
+    name — имя кэша в метриках попаданий. build() может вернуть Tagged, чтобы задать теги и срок записи.
+    """
+    return cached_entry(key, build, tags, timeout, name)[0]
+
+
+def cached_entry(key, build, tags=(), timeout=DEFAULT_TIMEOUT, name=None):
+    """То же, что cached(), но возвращает (значение, состояние): STALE, если отдано устаревшее значение."""
+
+    def record(outcome):
+        if name is not None:
+            cache_stats.record(name, outcome)
+
+    value, state = lookup(key, tags)
+    if state == FRESH:
+        record('hit')
+        return value, FRESH
+
+    lock_key = f"{key}_lock"
+    if cache.add(lock_key, True, timeout=LOCK_TIMEOUT):
+        record('miss')
+        try:
+            return build_and_set(key, build, tags, timeout), FRESH
+        finally:
+            cache.delete(lock_key)
+
+    if state == STALE:
+        record('stale')
+        return value, STALE
+
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        value, state = lookup(key, tags)
+        if state == FRESH:
+            record('hit')
+            return value, FRESH
+    record('miss')
+    return build_and_set(key, build, tags, timeout), FRESH
+
+
+def tags_condition(get_tags):
+    """
+    Декоратор метода get: ETag ответа строится из версий его тегов.
+    Если клиент прислал совпадающий If-None-Match, возвращается 304
+    без запросов к БД и сериализации. get_tags(request, *args, **kwargs) возвращает теги ответа.
+    Last-Modified не отдаётся: версии тегов точнее секунды, и изменение в ту же секунду,
+    что и If-Modified-Since клиента, дало бы ложный 304.
+    Ответ с устаревшим телом (served_stale) уходит без ETag.
+    """
+    return method_decorator(tag_conditions(get_tags))
+
+
+def tag_conditions(get_tags):
+    """То же, что tags_condition, для обычной функции представления."""
+
+    def versions(request, *args, **kwargs):
+        if not hasattr(request, '_tag_versions'):
+            request._tag_versions = get_tag_versions(get_tags(request, *args, **kwargs))
+        return request._tag_versions
+
+    def etag(request, *args, **kwargs):
+        state = sorted(versions(request, *args, **kwargs).items())
+        # Путь, Accept и Accept-Encoding различают представления одного набора данных
+        source = (f"{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}|"
+                  f"{request.META.get('HTTP_ACCEPT_ENCODING', '')}|{state}")
+        return hashlib.md5(source.encode('utf-8')).hexdigest()
+
+    def decorator(view):
+        conditional = condition(etag_func=etag)(view)
+
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            response = conditional(request, *args, **kwargs)
+            if getattr(response, 'served_stale', False):
+                # ETag текущих версий не описывает устаревшее тело: с ним клиент получал бы 304 и дальше
+                del response['ETag']
+            return response
+
+        return inner
+
+    return decorator
+
+
+def render_json(data):
+    """
+    Готовое тело ответа (байты, content type, сжатые варианты) для хранения в кэше:
+    попадание отдаётся как есть, без сериализатора, рендерера и сжатия.
+    """
+    renderer = get_json_renderer()
+    content = renderer.render(data)
+    return content, renderer.media_type, compress_variants(content)
+
+
+def json_response(request, rendered):
+    content, content_type, variants = rendered
+    if getattr(request, 'accepted_renderer', None) is not None and request.accepted_renderer.format != 'json':
+        # Browsable API и другие форматы строятся обычным путём из тех же данных
+        return Response(json.loads(content))
+
+    encoding = accepted_encoding(request, tuple(variants))
+    response = HttpResponse(variants[encoding] if encoding else content, content_type=content_type)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if variants:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def cached_json_response(request, key, build, tags=(), timeout=DEFAULT_TIMEOUT, name=None):
+    """То же, что cached(), но в кэше лежит отрендеренный JSON, а результат — готовый ответ."""
+    rendered, state = cached_entry(key, lambda: render_json(build()), tags, timeout, name)
+    response = json_response(request, rendered)
+    response.served_stale = state == STALE
+    return response
+
+
+class CachedResponseMixin:
+    """
+    Декларативный кэш GET для generic-представлений DRF. Атрибуты:
+        cache_name — имя кэша в ключах и метриках, по умолчанию имя класса;
+        cache_tags — теги ответа, подстановки берутся из kwargs URL, например 'house:{pk}';
+        cache_timeout — срок жизни записи;
+        cache_key_params — параметры запроса, от которых зависит ответ; None — все;
+        cache_vary_on_user — у каждого пользователя и у анонимов свой ответ;
+        cache_vary_on_host — в ответе есть абсолютные ссылки с хостом запроса.
+    Права проверяются до обращения к кэшу. Ответ хранится отрендеренным,
+    ETag строится из версий тегов, как у tags_condition.
+    """
+    cache_name = None
+    cache_tags = ()
+    cache_timeout = DEFAULT_TIMEOUT
+    cache_key_params = None
+    cache_vary_on_user = False
+    cache_vary_on_host = False
+
+    def get_cache_name(self):
+        return self.cache_name or type(self).__name__
+
+    def get_cache_tags(self, request, **kwargs):
+        return tuple(tag.format(**kwargs) for tag in self.cache_tags)
+
+    def get_cache_key(self, request, **kwargs):
+        parts = [self.get_cache_name(), *(f"{name}={value}" for name, value in sorted(kwargs.items()))]
+        if self.cache_vary_on_host:
+            parts.append(request.get_host())
+        if self.cache_vary_on_user:
+            parts.append(f"user={request.user.pk}" if request.user.is_authenticated else 'anonymous')
+
+        params = request.query_params
+        if self.cache_key_params is not None:
+            params = params.copy()
+            for param in list(params):
+                if param not in self.cache_key_params:
+                    del params[param]
+        return make_cache_key('_'.join(parts), params)
+
+    def get(self, request, *args, **kwargs):
+        def get_tags(request, *args, **kwargs):
+            return self.get_cache_tags(request, **kwargs)
+
+        response = tag_conditions(get_tags)(self.get_cached_response)(request, *args, **kwargs)
+        if self.cache_vary_on_user:
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def get_cached_response(self, request, *args, **kwargs):
+        return cached_json_response(
+            request, self.get_cache_key(request, **kwargs),
+            lambda: super(CachedResponseMixin, self).get(request, *args, **kwargs).data,
+            tags=self.get_cache_tags(request, **kwargs), timeout=self.cache_timeout, name=self.get_cache_name(),
+        )
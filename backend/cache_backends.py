@@ -0,0 +1,273 @@
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+logger = logging.getLogger(__name__)
+
+_missing = object()
+
+
+class TieredCache(BaseCache):
+    """
+    Двухуровневый кэш: небольшой LRU в памяти процесса (L1) перед общим кэшем (L2).
+
+    LOCATION — алиас кэша L2 из CACHES. Параметры OPTIONS:
+        L1_MAX_ENTRIES — размер L1, по умолчанию 1000;
+        L1_TIMEOUT — сколько секунд запись живёт в L1, по умолчанию 5;
+        BROADCAST_URL — адрес Redis для рассылки инвалидаций между процессами;
+        CHANNEL — канал pub/sub, по умолчанию cache-invalidation.
+
+    Каждая запись и удаление публикуются в канал, и остальные процессы выбрасывают
+    эти ключи из своего L1. Без BROADCAST_URL устаревание L1 ограничено L1_TIMEOUT.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.l2_alias = location
+        self.l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1000))
+        self.l1_timeout = float(options.get('L1_TIMEOUT', 5))
+        self.broadcast_url = options.get('BROADCAST_URL')
+        self.channel = options.get('CHANNEL', 'cache-invalidation')
+        self.node_id = uuid.uuid4().hex
+
+        self._l1 = OrderedDict()
+        # Растёт при каждой инвалидации: значение, прочитанное из L2 до неё, в L1 уже не кладётся
+        self._l1_generation = 0
+        self._lock = threading.Lock()
+        self._publisher = None
+        self._listener = None
+        self._listener_pid = None
+        self._stopped = threading.Event()
+
+    @property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    # L1
+
+    def _l1_get(self, key):
+        with self._lock:
+            item = self._l1.get(key)
+            if item is None:
+                return _missing
+            expires_at, pickled = item
+            if expires_at <= time.monotonic():
+                del self._l1[key]
+                return _missing
+            self._l1.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def _l1_set(self, key, value, timeout=DEFAULT_TIMEOUT, generation=None):
+        ttl = self.l1_timeout
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is not None:
+            ttl = min(ttl, timeout - time.time())
+        if ttl <= 0:
+            self._l1_drop([key])
+            return
+
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            if generation is not None and generation != self._l1_generation:
+                return
+            self._l1[key] = (time.monotonic() + ttl, pickled)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_drop(self, keys):
+        with self._lock:
+            self._l1_generation += 1
+            for key in keys:
+                self._l1.pop(key, None)
+
+    def _l1_clear(self):
+        with self._lock:
+            self._l1_generation += 1
+            self._l1.clear()
+
+    # Рассылка инвалидаций
+
+    def _ensure_listener(self):
+        if not self.broadcast_url or redis is None:
+            return
+        # После fork поток подписки не наследуется, его нужно запустить в каждом воркере
+        if self._listener_pid == os.getpid() and self._listener.is_alive():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid() and self._listener.is_alive():
+                return
+            self._l1_generation += 1
+            self._l1.clear()
+            self._publisher = None
+            self._stopped.clear()
+            self._listener = threading.Thread(target=self._listen, name='tiered-cache-listener', daemon=True)
+            self._listener_pid = os.getpid()
+            self._listener.start()
+
+    def _listen(self):
+        delay = 0.1
+        while not self._stopped.is_set():
+            pubsub = None
+            try:
+                pubsub = redis.Redis.from_url(self.broadcast_url).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Пока подписки не было, сообщения могли потеряться
+                self._l1_clear()
+                delay = 0.1
+                while not self._stopped.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        self._handle_message(message['data'])
+            except Exception:
+                logger.warning("Подписка на инвалидации кэша прервана, переподключение", exc_info=True)
+                self._l1_clear()
+                self._stopped.wait(delay)
+                delay = min(delay * 2, 5)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def _handle_message(self, data):
+        try:
+            message = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        if message.get('node') == self.node_id:
+            return
+        if message.get('clear'):
+            self._l1_clear()
+        else:
+            self._l1_drop(message.get('keys', []))
+
+    def _publish(self, keys=None, clear=False):
+        if not self.broadcast_url or redis is None:
+            return
+        self._ensure_listener()
+        message = {'node': self.node_id}
+        if clear:
+            message['clear'] = True
+        else:
+            message['keys'] = list(keys)
+        try:
+            if self._publisher is None:
+                self._publisher = redis.Redis.from_url(self.broadcast_url)
+            self._publisher.publish(self.channel, json.dumps(message))
+        except Exception:
+            logger.warning("Не удалось разослать инвалидацию кэша", exc_info=True)
+            self._publisher = None
+
+    def close_broadcast(self):
+        self._stopped.set()
+        if self._listener is not None:
+            self._listener.join(timeout=5)
+
+    # API кэша Django
+
+    def get(self, key, default=None, version=None):
+        self._ensure_listener()
+        l1_key = self.make_and_validate_key(key, version=version)
+        value = self._l1_get(l1_key)
+        if value is not _missing:
+            return value
+
+        generation = self._l1_generation
+        value = self.l2.get(key, _missing, version=version)
+        if value is _missing:
+            return default
+        self._l1_set(l1_key, value, generation=generation)
+        return value
+
+    def get_many(self, keys, version=None):
+        self._ensure_listener()
+        found = {}
+        misses = []
+        for key in keys:
+            value = self._l1_get(self.make_and_validate_key(key, version=version))
+            if value is _missing:
+                misses.append(key)
+            else:
+                found[key] = value
+
+        if misses:
+            generation = self._l1_generation
+            for key, value in self.l2.get_many(misses, version=version).items():
+                self._l1_set(self.make_and_validate_key(key, version=version), value, generation=generation)
+                found[key] = value
+        return found
+
+    def has_key(self, key, version=None):
+        return self.get(key, _missing, version=version) is not _missing
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        self.l2.set(key, value, timeout=timeout, version=version)
+        self._l1_set(l1_key, value, timeout)
+        self._publish([l1_key])
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        if not self.l2.add(key, value, timeout=timeout, version=version):
+            return False
+        self._l1_set(l1_key, value, timeout)
+        self._publish([l1_key])
+        return True
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout=timeout, version=version)
+        l1_keys = []
+        for key, value in data.items():
+            l1_key = self.make_and_validate_key(key, version=version)
+            l1_keys.append(l1_key)
+            if key not in failed:
+                self._l1_set(l1_key, value, timeout)
+        self._publish(l1_keys)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        self._l1_drop([l1_key])
+        return self.l2.touch(key, timeout=timeout, version=version)
+
+    def delete(self, key, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        self._l1_drop([l1_key])
+        deleted = self.l2.delete(key, version=version)
+        self._publish([l1_key])
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        l1_keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        self._l1_drop(l1_keys)
+        self.l2.delete_many(keys, version=version)
+        self._publish(l1_keys)
+
+    def incr(self, key, delta=1, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        self._l1_drop([l1_key])
+        value = self.l2.incr(key, delta, version=version)
+        self._publish([l1_key])
+        return value
+
+    def clear(self):
+        self._l1_clear()
+        self.l2.clear()
+        self._publish(clear=True)
@@ -0,0 +1,215 @@
+import time
+from threading import Lock
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import House
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+COLUMNS = (
+    'price', 'effective_price', 'area', 'living_area', 'floors', 'rooms', 'bedrooms', 'garage',
+    'category_id', 'construction_technology_id',
+)
+
+# Имена полей в lookup'ах ORM, которые хранятся в индексе под другим именем
+FIELD_COLUMNS = {
+    'category': 'category_id',
+    'construction_technology': 'construction_technology_id',
+}
+
+INDEX_OPERATIONS = ('exact', 'gte', 'lte', 'in')
+
+
+def to_float(value):
+    return float('nan') if value is None else float(value)
+
+
+class CatalogIndex:
+    """
+    Числовые и категориальные колонки домов в массивах NumPy.
+    Фильтры и сортировки считаются векторно, из БД затем читается только страница по id.
+    Снимок (ids, columns) заменяется целиком, поэтому читатели работают без блокировки.
+    """
+
+    def __init__(self):
+        self.snapshot = None
+        self.loaded_at = None
+        self._lock = Lock()
+
+    @property
+    def loaded(self):
+        return self.snapshot is not None
+
+    def load(self):
+        rows = list(House.objects.order_by('id').values_list('id', *COLUMNS))
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        columns = {
+            name: np.array([to_float(row[position]) for row in rows], dtype=np.float64)
+            for position, name in enumerate(COLUMNS, start=1)
+        }
+        with self._lock:
+            self.snapshot = (ids, columns)
+            self.loaded_at = time.monotonic()
+
+    @staticmethod
+    def row_for(house):
+        return {name: to_float(getattr(house, name)) for name in COLUMNS}
+
+    def upsert(self, house_id, row):
+        with self._lock:
+            if self.snapshot is None:
+                return
+            ids, columns = self.snapshot
+            position = int(np.searchsorted(ids, house_id))
+
+            if position < len(ids) and ids[position] == house_id:
+                columns = {name: values.copy() for name, values in columns.items()}
+                for name, values in columns.items():
+                    values[position] = row[name]
+            else:
+                ids = np.insert(ids, position, house_id)
+                columns = {name: np.insert(values, position, row[name]) for name, values in columns.items()}
+            self.snapshot = (ids, columns)
+
+    def remove(self, house_id):
+        with self._lock:
+            if self.snapshot is None:
+                return
+            ids, columns = self.snapshot
+            position = int(np.searchsorted(ids, house_id))
+            if position == len(ids) or ids[position] != house_id:
+                return
+            self.snapshot = (
+                np.delete(ids, position),
+                {name: np.delete(values, position) for name, values in columns.items()},
+            )
+
+    def query(self, conditions, ordering=('id',)):
+        """
+        conditions: список (колонка, операция, значение), операции — exact, gte, lte, in.
+        ordering: колонки сортировки, '-' в начале означает убывание.
+        Возвращает массив id подходящих домов в нужном порядке.
+        """
+        ids, columns = self.snapshot
+        mask = np.ones(len(ids), dtype=bool)
+
+        for column, operation, value in conditions:
+            values = ids if column == 'id' else columns[column]
+            if operation == 'exact':
+                mask &= values == value
+            elif operation == 'gte':
+                mask &= values >= value
+            elif operation == 'lte':
+                mask &= values <= value
+            elif operation == 'in':
+                mask &= np.isin(values, value)
+
+        selected = np.flatnonzero(mask)
+        keys = []
+        # np.lexsort сортирует по последнему ключу в первую очередь
+        for name in reversed(ordering):
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            values = (ids if name == 'id' else columns[name])[selected]
+            keys.append(-values if descending else values)
+        return ids[selected[np.lexsort(keys)]] if keys else ids[selected]
+
+
+class IndexedHouses:
+    """
+    Результат запроса к индексу, который ведёт себя как QuerySet для пагинации и сериализации:
+    count(), срезы и итерация загружают из БД только нужные id в порядке индекса.
+    """
+
+    def __init__(self, ids, queryset=None):
+        self.ids = ids
+        self.queryset = House.objects.all() if queryset is None else queryset
+
+    def count(self):
+        return len(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.fetch(self.ids[key].tolist())
+        return self.fetch([int(self.ids[key])])[0]
+
+    def fetch(self, ids):
+        houses = self.queryset.in_bulk(ids)
+        return [houses[house_id] for house_id in ids if house_id in houses]
+
+    def for_listing(self, fields=None):
+        return IndexedHouses(self.ids, self.queryset.for_listing(fields))
+
+    def for_cards(self, fields=None):
+        return IndexedHouses(self.ids, self.queryset.for_cards(fields))
+
+
+def lookup_conditions(lookups):
+    """
+    Переводит lookup'ы ORM вида field__gte в условия индекса.
+    Возвращает None, если хотя бы один lookup индексом не поддерживается.
+    """
+    conditions = []
+    for lookup, value in lookups.items():
+        field_name, _, operation = lookup.rpartition('__')
+        column = FIELD_COLUMNS.get(field_name, field_name)
+        if column not in COLUMNS or operation not in INDEX_OPERATIONS:
+            return None
+        try:
+            value = [float(item) for item in value] if operation == 'in' else float(value)
+        except (TypeError, ValueError):
+            return None
+        conditions.append((column, operation, value))
+    return conditions
+
+
+_index = CatalogIndex()
+
+
+def get_catalog_index():
+    """
+    Индекс текущего процесса или None, если он выключен в настройках или NumPy не установлен.
+    Изменения из других процессов подхватываются перезагрузкой по CATALOG_INDEX_MAX_AGE.
+    """
+    if np is None or not getattr(settings, 'CATALOG_INDEX_ENABLED', False):
+        return None
+
+    max_age = getattr(settings, 'CATALOG_INDEX_MAX_AGE', 300)
+    if not _index.loaded or (max_age is not None and time.monotonic() - _index.loaded_at > max_age):
+        _index.load()
+    return _index
+
+
+def query_houses(conditions, ordering=('id',)):
+    index = get_catalog_index()
+    if index is None or conditions is None:
+        return None
+    return IndexedHouses(index.query(conditions, ordering))
+
+
+def index_house_saved(house):
+    if not _index.loaded:
+        return
+    # Значения снимаются сразу: к моменту коммита экземпляр может измениться
+    house_id, row = house.pk, CatalogIndex.row_for(house)
+    transaction.on_commit(lambda: _index.upsert(house_id, row))
+
+
+def index_house_deleted(house):
+    if not _index.loaded:
+        return
+    # После удаления Django обнуляет pk экземпляра
+    house_id = house.pk
+    transaction.on_commit(lambda: _index.remove(house_id))
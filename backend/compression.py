@@ -0,0 +1,109 @@
+import gzip
+
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Меньшие ответы не сжимаются: выигрыш не окупает заголовки и работу процессора
+MIN_SIZE = 512
+COMPRESSIBLE_TYPES = ('application/json',)
+GZIP_LEVEL = 6
+# Варианты для кэша сжимаются один раз на промах, поэтому сильнее, чем ответы на лету
+BROTLI_QUALITY = 5
+CACHED_BROTLI_QUALITY = 9
+
+_q_value_re = _lazy_re_compile(r'^q=([0-9.]+)$')
+
+
+def supported_encodings():
+    """Кодировки в порядке предпочтения сервера."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(content, encoding, quality=BROTLI_QUALITY):
+    if encoding == 'br':
+        return brotli.compress(content, quality=quality)
+    return gzip.compress(content, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_variants(content):
+    """Сжатые варианты тела {кодировка: байты} для хранения рядом с исходным в кэше."""
+    if len(content) < MIN_SIZE:
+        return {}
+    return {encoding: compress(content, encoding, CACHED_BROTLI_QUALITY) for encoding in supported_encodings()}
+
+
+def accepted_encoding(request, encodings):
+    """
+    Лучшая из encodings по заголовку Accept-Encoding с учётом q-значений или None.
+    При равных весах побеждает порядок encodings.
+    """
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    if not header or not encodings:
+        return None
+
+    weights = {}
+    for item in header.split(','):
+        name, *params = [part.strip() for part in item.split(';')]
+        weight = 1.0
+        for param in params:
+            match = _q_value_re.match(param)
+            if match:
+                try:
+                    weight = float(match[1])
+                except ValueError:
+                    weight = 0.0
+        if name:
+            weights[name.lower()] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in encodings:
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def is_compressible(response):
+    content_type = response.get('Content-Type', '').split(';')[0].strip()
+    return content_type in COMPRESSIBLE_TYPES
+
+
+class CompressionMiddleware:
+    """
+    Сжимает JSON-ответы в brotli или gzip по Accept-Encoding.
+    Ответы, которые уже пришли сжатыми (готовые варианты из кэша), не трогает.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.streaming or response.has_header('Content-Encoding') or not is_compressible(response):
+            return response
+        if len(response.content) < MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = accepted_encoding(request, supported_encodings())
+        if encoding is None:
+            return response
+
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # Сжатое тело отличается побайтно, поэтому сильный ETag становится слабым, как в GZipMiddleware
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,100 @@
+from threading import Lock
+
+from django import forms
+from django_filters.constants import EMPTY_VALUES
+
+from .cache import get_tag_versions
+from .models import FilterOption
+
+
+IGNORED_VALUES = ('all', '', None)
+
+
+class FilterPlan:
+    """
+    Скомпилированный набор фильтров каталога из строк FilterOption.
+    Каждая запись: (параметр запроса, lookup ORM, поле формы для очистки значения).
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def cleaned_lookups(self, filters):
+        lookups = {}
+
+        for param, lookup, form_field in self.entries:
+            value = filters.get(param)
+            if value in IGNORED_VALUES:
+                continue
+            try:
+                value = form_field.clean(value)
+            except forms.ValidationError:
+                continue
+            if value in EMPTY_VALUES:
+                continue
+            lookups[lookup] = value
+        return lookups
+
+    def apply(self, filters, queryset):
+        lookups = self.cleaned_lookups(filters)
+        if not lookups:
+            return queryset
+        return queryset.filter(**lookups)
+
+
+def compile_filter_plan(filter_options):
+    entries = {}
+
+    for filter_option in filter_options:
+        field_name = filter_option.field_name
+        if filter_option.filter_type == 'exact':
+            entries[field_name] = (f"{field_name}__exact", forms.CharField(required=False))
+        elif filter_option.filter_type == 'range':
+            entries[field_name + '__gte'] = (f"{field_name}__gte", forms.DecimalField(required=False))
+            entries[field_name + '__lte'] = (f"{field_name}__lte", forms.DecimalField(required=False))
+        elif filter_option.filter_type == 'contains':
+            entries[field_name] = (f"{field_name}__icontains", forms.CharField(required=False))
+
+    return FilterPlan([(param, lookup, form_field) for param, (lookup, form_field) in entries.items()])
+
+
+_plan = None
+_plan_version = None
+_plan_generation = 0
+_plan_lock = Lock()
+
+
+def get_filter_plan():
+    """
+    План фильтров процесса. Сверяется с версией тега filter_options в общем кэше,
+    чтобы изменения FilterOption в другом процессе тоже приводили к пересборке.
+    """
+    global _plan, _plan_version
+
+    version = get_tag_versions(['filter_options'])['filter_options']
+    plan = _plan
+    if plan is not None and _plan_version == version:
+        return plan
+
+    with _plan_lock:
+        generation = _plan_generation
+
+    plan = compile_filter_plan(FilterOption.objects.all())
+
+    with _plan_lock:
+        # Если во время сборки пришёл сброс, план уже устарел и не кэшируется
+        if generation == _plan_generation:
+            _plan = plan
+            _plan_version = version
+    return plan
+
+
+def reset_filter_plan():
+    global _plan, _plan_generation
+
+    with _plan_lock:
+        _plan = None
+        _plan_generation += 1
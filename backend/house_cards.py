@@ -0,0 +1,111 @@
+import json
+from threading import local
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import House, HouseCard
+from .renderers import get_json_renderer
+from .serializer import HouseSerializer, HouseCardSerializer
+
+
+BUILD_BATCH_SIZE = 200
+
+_pending = local()
+
+
+def house_cards_enabled():
+    return getattr(settings, 'HOUSE_CARDS_ENABLED', False)
+
+
+def as_json(data):
+    # Через рендерер API: Decimal и даты хранятся ровно в том виде, в каком их отдаёт сериализатор
+    return json.loads(get_json_renderer().render(data))
+
+
+def build_house_cards(house_ids=None, category_ids=()):
+    """
+    Пересобирает карточки домов house_ids и домов категорий category_ids; house_ids=None — всех домов.
+    Карточки удалённых домов удаляются каскадом вместе с домом.
+    """
+    houses = House.objects.all()
+    if house_ids is not None:
+        houses = houses.filter(Q(pk__in=house_ids) | Q(category_id__in=category_ids))
+    ids = list(houses.order_by('pk').values_list('pk', flat=True))
+
+    for start in range(0, len(ids), BUILD_BATCH_SIZE):
+        batch = House.objects.filter(pk__in=ids[start:start + BUILD_BATCH_SIZE]).order_by('pk')
+        listing = list(batch.for_listing())
+        listing_data = as_json(HouseSerializer(listing, many=True).data)
+        card_data = {item['id']: item for item in as_json(HouseCardSerializer(batch.for_cards(), many=True).data)}
+
+        cards = [
+            HouseCard(house=house, listing=data, card=card_data[house.pk],
+                      **{name: getattr(house, name) for name in HouseCard.HOUSE_FIELDS})
+            for house, data in zip(listing, listing_data)
+        ]
+        HouseCard.objects.bulk_create(
+            cards, update_conflicts=True, unique_fields=['house'],
+            update_fields=[*HouseCard.HOUSE_FIELDS, 'listing', 'card', 'updated_at'],
+        )
+
+
+def schedule_house_cards(house_ids=None, category_ids=()):
+    """
+    Пересборка карточек после коммита. Вызовы одной транзакции копятся и выполняются
+    одной пересборкой: дом с десятком изображений собирается один раз, а не на каждое добавление.
+    Вне transaction.atomic() Django выполняет on_commit сразу, и каждый вызов пересобирает
+    карточки немедленно, поэтому массовые изменения домов делаются внутри atomic().
+    """
+    if not house_cards_enabled():
+        return
+    if house_ids is None:
+        _pending.everything = True
+    else:
+        _pending.house_ids = getattr(_pending, 'house_ids', set()) | set(house_ids)
+    _pending.category_ids = getattr(_pending, 'category_ids', set()) | {pk for pk in category_ids if pk}
+
+    # Пересборка ставится один раз на транзакцию соединения и снимает признак сама. Признак сверяется
+    # со списком колбэков: при откате транзакции или точки сохранения Django убирает из него пересборку
+    connection = transaction.get_connection()
+    scheduled = getattr(_pending, 'scheduled', None)
+    if scheduled is None or scheduled not in connection.run_on_commit:
+        transaction.on_commit(flush_house_cards)
+        if connection.in_atomic_block:
+            _pending.scheduled = connection.run_on_commit[-1]
+
+
+def flush_house_cards():
+    everything = getattr(_pending, 'everything', False)
+    house_ids = getattr(_pending, 'house_ids', set())
+    category_ids = getattr(_pending, 'category_ids', set())
+    _pending.everything, _pending.house_ids, _pending.category_ids = False, set(), set()
+    _pending.scheduled = None
+
+    if everything:
+        build_house_cards()
+    elif house_ids or category_ids:
+        build_house_cards(house_ids, category_ids)
+
+
+def house_cards():
+    """QuerySet карточек для чтения списков или None, если таблица выключена в настройках."""
+    return HouseCard.objects.all() if house_cards_enabled() else None
+
+
+def supports_lookups(lookups):
+    fields = {field.name for field in HouseCard._meta.get_fields()} | {'category_id', 'construction_technology_id'}
+    return all(lookup.split('__')[0] in fields for lookup in lookups)
+
+
+def card_ordering(ordering):
+    """Сортировка домов в терминах карточек: id дома — это house_id."""
+    return [name.replace('id', 'house_id') if name.lstrip('-') == 'id' else name for name in ordering]
+
+
+def card_payloads(items, fields=None):
+    """Готовые данные карточек, урезанные до fields так же, как SparseFieldsMixin."""
+    if fields is None:
+        return list(items)
+    return [{name: value for name, value in item.items() if name in fields} for item in items]
@@ -0,0 +1,122 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image as PILImage, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+# Ширины вариантов в пикселях; больше исходной ширины варианты не создаются
+VARIANT_WIDTHS = (320, 640, 1280)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+VARIANTS_DIR = 'variants'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def image_variants_enabled():
+    return getattr(settings, 'IMAGE_VARIANTS_ENABLED', True)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'IMAGE_VARIANT_WORKERS', 2),
+                                           thread_name_prefix='image-variants')
+        return _executor
+
+
+def variant_name(name, width, fmt):
+    """Имя файла варианта: house_images/a.png -> variants/house_images/a_640.webp."""
+    return f"{VARIANTS_DIR}/{os.path.splitext(name)[0]}_{width}.{VARIANT_FORMATS[fmt][1]}"
+
+
+def generate_variants(storage, name):
+    """
+    Создаёт варианты изображения name для ширин меньше исходной.
+    Возвращает {ширина: {формат: имя файла}}; ключи — строки, как после JSONField.
+    """
+    with storage.open(name) as source:
+        picture = PILImage.open(source)
+        # JPEG сразу декодируется в уменьшенном масштабе, не меньше самого крупного варианта
+        picture.draft('RGB', (max(VARIANT_WIDTHS), max(VARIANT_WIDTHS)))
+        picture = ImageOps.exif_transpose(picture)
+        picture.load()
+
+    has_alpha = picture.mode in ('RGBA', 'LA', 'PA') or 'transparency' in picture.info
+    picture = picture.convert('RGBA' if has_alpha else 'RGB')
+
+    variants = {}
+    for width in VARIANT_WIDTHS:
+        if width >= picture.width:
+            break
+        height = max(1, round(picture.height * width / picture.width))
+        resized = picture.resize((width, height), PILImage.Resampling.LANCZOS, reducing_gap=3.0)
+
+        variants[str(width)] = {}
+        for fmt, (pil_format, _, options) in VARIANT_FORMATS.items():
+            frame = resized
+            if pil_format == 'JPEG' and has_alpha:
+                # В JPEG нет прозрачности: подкладывается белый фон
+                frame = PILImage.new('RGB', resized.size, 'white')
+                frame.paste(resized, mask=resized.getchannel('A'))
+            buffer = io.BytesIO()
+            frame.save(buffer, pil_format, **options)
+
+            target = variant_name(name, width, fmt)
+            if storage.exists(target):
+                storage.delete(target)
+            variants[str(width)][fmt] = storage.save(target, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def existing_variants(storage, name):
+    """Уже построенные варианты name в том же виде, что и у generate_variants."""
+    variants = {}
+    for width in VARIANT_WIDTHS:
+        names = {fmt: variant_name(name, width, fmt) for fmt in VARIANT_FORMATS}
+        if not all(storage.exists(variant) for variant in names.values()):
+            break
+        variants[str(width)] = names
+    return variants
+
+
+def schedule_variants(field_file, on_ready=None):
+    """
+    После коммита ставит построение вариантов файла в пул потоков.
+    on_ready(variants) вызывается в потоке пула, когда варианты готовы.
+    """
+    if not image_variants_enabled() or not field_file:
+        return
+    storage, name = field_file.storage, field_file.name
+    transaction.on_commit(lambda: get_executor().submit(run_in_pool, storage, name, on_ready))
+
+
+def build_variants(storage, name, on_ready=None):
+    """Варианты файла: готовые, если они уже есть (повторное сохранение объекта), иначе строятся заново."""
+    if not storage.exists(name):
+        return
+    variants = existing_variants(storage, name) or generate_variants(storage, name)
+    if on_ready is not None:
+        on_ready(variants)
+
+
+def run_in_pool(storage, name, on_ready):
+    try:
+        build_variants(storage, name, on_ready)
+    except Exception:
+        logger.exception("Не удалось построить варианты изображения %s", name)
+    finally:
+        # Соединение с БД принадлежит потоку пула и не закрывается обработчиками запроса
+        connection.close()
@@ -0,0 +1,249 @@
+import io
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+import django_filters
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework.parsers import JSONParser
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from backend.cache import cached, cached_json_response, get_cached, set_cached, invalidate_tags, house_cache_tags
+from backend.filters import get_filter_plan, reset_filter_plan
+from backend.models import House, FilterOption, Order
+from backend.renderers import FastJSONParser, FastJSONRenderer
+from backend.serializer import HouseSerializer, OrderSerializer
+from backend.views import HouseDetailView
+
+
+SAMPLE_FILTER_OPTIONS = [
+    ('Этажность', 'floors', 'exact'),
+    ('Комнаты', 'rooms', 'exact'),
+    ('Спальни', 'bedrooms', 'exact'),
+    ('Цена', 'price', 'range'),
+    ('Площадь', 'area', 'range'),
+    ('Название', 'title', 'contains'),
+]
+
+SAMPLE_FILTERS = {'floors': '2', 'price__gte': '1000000', 'price__lte': '5000000', 'title': 'дом'}
+
+
+class Rollback(Exception):
+    pass
+
+
+class LegacyHouseFilter(django_filters.FilterSet):
+    class Meta:
+        model = House
+        fields = {}
+
+
+def legacy_dynamic_filter(filters, queryset):
+    filter_dict = {}
+    cleaned_filters = {k: v for k, v in filters.items() if v not in ['all', '', None]}
+
+    for filter_option in FilterOption.objects.all():
+        if filter_option.filter_type == 'exact':
+            filter_dict[filter_option.field_name] = django_filters.CharFilter(field_name=filter_option.field_name)
+        elif filter_option.filter_type == 'range':
+            filter_dict[filter_option.field_name + '__gte'] = django_filters.NumberFilter(
+                field_name=filter_option.field_name, lookup_expr='gte')
+            filter_dict[filter_option.field_name + '__lte'] = django_filters.NumberFilter(
+                field_name=filter_option.field_name, lookup_expr='lte')
+        elif filter_option.filter_type == 'contains':
+            filter_dict[filter_option.field_name] = django_filters.CharFilter(
+                field_name=filter_option.field_name, lookup_expr='icontains')
+
+    house_filter = LegacyHouseFilter(cleaned_filters, queryset=queryset)
+    house_filter.filters.update(filter_dict)
+    return house_filter.qs
+
+
+def compiled_dynamic_filter(filters, queryset):
+    return get_filter_plan().apply(filters, queryset)
+
+
+def naive_cached(key, build, tags=(), timeout=60 * 10):
+    """Прежняя схема: каждый, кто не нашёл значение, пересобирает его сам."""
+    value = get_cached(key, tags)
+    if value is None:
+        value = build()
+        set_cached(key, value, tags, timeout)
+    return value
+
+
+class LegacyHouseDetailView(HouseDetailView):
+    """Прежнее чтение дома: сначала get_object() с prefetch, затем кэш."""
+
+    def get(self, request, *args, **kwargs):
+        house = self.get_object()
+        return cached_json_response(request, f"benchmark_legacy_house_detail_{house.id}",
+                                    lambda: HouseSerializer(house).data, tags=house_cache_tags(house), timeout=60 * 10)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(func, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+class Command(BaseCommand):
+    help = "Микробенчмарки горячих участков каталога. Данные создаются во временной транзакции и откатываются."
+
+    scenarios = ('filters', 'stampede', 'json', 'detail')
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=self.scenarios)
+        parser.add_argument('--iterations', type=int, help="Число повторов; по умолчанию своё для каждого сценария")
+        parser.add_argument('--threads', type=int, default=16, help="Число одновременных запросов (stampede)")
+
+    def handle(self, *args, **options):
+        self.threads = options['threads']
+        bench = getattr(self, f"bench_{options['scenario']}")
+        try:
+            with transaction.atomic():
+                if options['iterations']:
+                    bench(options['iterations'])
+                else:
+                    bench()
+                raise Rollback
+        except Rollback:
+            pass
+
+    def report(self, label, before, after):
+        self.stdout.write(f"{label}: до {before:.1f} мкс, после {after:.1f} мкс, ускорение x{before / after:.1f}")
+
+    def bench_filters(self, iterations=1000):
+        if not FilterOption.objects.exists():
+            FilterOption.objects.bulk_create([
+                FilterOption(name=name, field_name=field_name, filter_type=filter_type)
+                for name, field_name, filter_type in SAMPLE_FILTER_OPTIONS
+            ])
+        reset_filter_plan()
+
+        queryset = House.objects.all()
+        before = measure(lambda: legacy_dynamic_filter(SAMPLE_FILTERS, queryset), iterations)
+        after = measure(lambda: compiled_dynamic_filter(SAMPLE_FILTERS, queryset), iterations)
+
+        self.stdout.write(f"Опций фильтра: {FilterOption.objects.count()}, итераций: {iterations}")
+        self.report("Построение фильтра", before, after)
+        reset_filter_plan()
+
+    def bench_stampede(self, iterations=20):
+        """
+        Момент инвалидации горячего ключа: все потоки одновременно приходят за значением.
+        Потоки работают в своих соединениях, поэтому видят только уже сохранённые в БД дома.
+        """
+        def build():
+            houses = House.objects.for_listing()[:6]
+            time.sleep(0.02)
+            return HouseSerializer(houses, many=True).data
+
+        self.stdout.write(f"Потоков: {self.threads}, инвалидаций: {iterations}")
+        for label, strategy in (('без защиты', naive_cached), ('с блокировкой', cached)):
+            counter = QueryCounter()
+            builds = [0]
+            lock = threading.Lock()
+
+            def counted_build():
+                with lock:
+                    builds[0] += 1
+                return build()
+
+            key = f"benchmark_stampede_{uuid.uuid4().hex}"
+            tag = f"benchmark:{key}"
+            strategy(key, counted_build, tags=(tag,))
+            builds[0] = counter.count = 0
+
+            started = time.perf_counter()
+            for _ in range(iterations):
+                invalidate_tags(tag)
+                self.run_concurrently(lambda: strategy(key, counted_build, tags=(tag,)), counter)
+            elapsed = (time.perf_counter() - started) / iterations * 1000
+
+            self.stdout.write(
+                f"{label}: пересборок на инвалидацию {builds[0] / iterations:.1f}, "
+                f"запросов к БД {counter.count / iterations:.1f}, время волны {elapsed:.1f} мс"
+            )
+
+    def bench_json(self, iterations=200):
+        house = House.objects.first()
+        if house is None:
+            self.stdout.write("Нет домов для сериализации")
+            return
+        # Заказы не сохраняются: для сериализации достаточно экземпляров в памяти
+        orders = [
+            Order(id=number, first_name='Иван', last_name='Иванов', phone='+79990000000', house=house,
+                  construction_place='Москва', message='Перезвоните', latitude=Decimal('55.755826'),
+                  longitude=Decimal('37.617300'))
+            for number in range(1, 201)
+        ]
+
+        payloads = (
+            ('HouseSerializer', HouseSerializer(House.objects.for_listing(), many=True).data),
+            ('OrderSerializer', OrderSerializer(orders, many=True).data),
+        )
+        for label, data in payloads:
+            content = JSONRenderer().render(data)
+            self.stdout.write(f"{label}: объектов {len(data)}, {len(content) / 1024:.1f} КБ, итераций {iterations}")
+            self.report("  рендер", measure(lambda: JSONRenderer().render(data), iterations),
+                        measure(lambda: FastJSONRenderer().render(data), iterations))
+            self.report("  разбор", measure(lambda: JSONParser().parse(io.BytesIO(content)), iterations),
+                        measure(lambda: FastJSONParser().parse(io.BytesIO(content)), iterations))
+
+    def bench_detail(self, iterations=500):
+        house = House.objects.first()
+        if house is None:
+            self.stdout.write("Нет домов для чтения")
+            return
+        factory = APIRequestFactory()
+        missing_pk = House.objects.order_by('-pk').values_list('pk', flat=True).first() + 1
+        cases = (('попадание', house.pk), ('404', missing_pk))
+
+        self.stdout.write(f"Итераций: {iterations}")
+        for label, pk in cases:
+            timings, queries = [], []
+            for view in (LegacyHouseDetailView.as_view(), HouseDetailView.as_view()):
+                def request():
+                    view(factory.get(f'/houses/{pk}/'), pk=pk)
+
+                request()
+                with CaptureQueriesContext(connection) as context:
+                    request()
+                queries.append(len(context.captured_queries))
+                timings.append(measure(request, iterations))
+            self.report(f"{label} (запросов к БД: до {queries[0]}, после {queries[1]})", *timings)
+
+    def run_concurrently(self, func, counter):
+        barrier = threading.Barrier(self.threads)
+
+        def worker():
+            try:
+                with connection.execute_wrapper(counter):
+                    barrier.wait()
+                    func()
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from backend.image_variants import build_variants
+from backend.models import Image, FinishingOption, Blog
+from backend.signals import store_image_variants, store_finishing_option_variants, store_blog_variants
+
+
+class Command(BaseCommand):
+    help = "Строит уменьшенные копии изображений, загруженных до появления фоновой обработки."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true', help="Только изображения без вариантов")
+
+    def handle(self, *args, **options):
+        images = Image.objects.all()
+        if options['missing']:
+            images = images.filter(variants={})
+        total = images.count()
+        for image in images.iterator():
+            if image.image:
+                build_variants(image.image.storage, image.image.name,
+                               lambda variants, pk=image.pk: store_image_variants(pk, variants))
+        self.stdout.write(f"Изображений домов: {total}")
+
+        finishing_options = FinishingOption.objects.all()
+        if options['missing']:
+            finishing_options = finishing_options.filter(image_variants={})
+        for option in finishing_options.iterator():
+            if option.image:
+                build_variants(option.image.storage, option.image.name,
+                               lambda variants, pk=option.pk: store_finishing_option_variants(pk, variants))
+
+        blogs = Blog.objects.all()
+        if options['missing']:
+            blogs = blogs.filter(image_variants={})
+        for blog in blogs.iterator():
+            if blog.image:
+                build_variants(blog.image.storage, blog.image.name,
+                               lambda variants, pk=blog.pk: store_blog_variants(pk, variants))
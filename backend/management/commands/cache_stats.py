@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from backend.cache import cache_stats
+
+
+class Command(BaseCommand):
+    help = "Попадания в кэши ответов по всем воркерам: hit, stale, miss и доля ответов из кэша."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Обнулить счётчики после вывода")
+
+    def handle(self, *args, **options):
+        stats = cache_stats.snapshot()
+        if not stats:
+            self.stdout.write("Счётчиков пока нет")
+
+        for name, counts in stats.items():
+            hit_rate = '—' if counts['hit_rate'] is None else f"{counts['hit_rate']:.1%}"
+            self.stdout.write(f"{name}: hit {counts['hit']}, stale {counts['stale']}, "
+                              f"miss {counts['miss']}, из кэша {hit_rate}")
+
+        if options['reset']:
+            cache_stats.reset()
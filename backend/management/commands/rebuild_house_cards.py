@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from backend.house_cards import build_house_cards
+from backend.models import HouseCard
+
+
+class Command(BaseCommand):
+    help = "Пересобирает денормализованные карточки всех домов (HouseCard)."
+
+    def handle(self, *args, **options):
+        build_house_cards()
+        self.stdout.write(f"Карточек: {HouseCard.objects.count()}")
@@ -0,0 +1,261 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_safe
+from PIL import Image as PILImage, ImageOps
+
+from .cache import LOCK_TIMEOUT, LOCK_WAIT, LOCK_POLL_INTERVAL
+
+
+# Pillow-формат и content type для поддерживаемых расширений; результат сохраняется в формате исходника
+RESIZE_FORMATS = {
+    '.jpg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    '.jpeg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    '.png': ('PNG', 'image/png', {'optimize': True}),
+    '.webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+}
+# URL не зависит от версии исходника: после его замены клиенты сверяют копию по ETag
+RESIZE_MAX_AGE = 60 * 10
+# Повреждённый исходник не перечитывается на каждый запрос, пока не изменится сам файл
+BROKEN_SOURCE_TIMEOUT = 60 * 10
+
+
+class DiskLRUCache:
+    """
+    Кэш файлов на диске, ограниченный по суммарному размеру.
+    Время последнего обращения — mtime файла: попадание его обновляет, а при переполнении
+    удаляются самые давние файлы, пока размер не опустится до low_water от лимита.
+    Общий каталог работает и между процессами; учёт размера в памяти процесса приблизительный
+    и уточняется полным обходом каталога при каждой очистке.
+    """
+
+    def __init__(self, directory, max_bytes, low_water=0.9):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.size = None
+        self.lock = threading.Lock()
+
+    def path(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def set(self, key, content):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Запись во временный файл и переименование: читатели не увидят недописанный файл
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as temp_file:
+            temp_file.write(content)
+        os.replace(temp_path, path)
+
+        with self.lock:
+            if self.size is None:
+                self.size = self.scan_size()
+            else:
+                self.size += len(content)
+            if self.size > self.max_bytes:
+                self.evict()
+        return path
+
+    def entries(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.startswith('.tmp-'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def scan_size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        entries = sorted(self.entries())
+        size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * self.low_water
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+        self.size = size
+
+
+_disk_cache = None
+_key_locks = {}
+_key_locks_guard = threading.Lock()
+
+
+def get_disk_cache():
+    global _disk_cache
+    directory = getattr(settings, 'MEDIA_RESIZE_CACHE_DIR', os.path.join(settings.BASE_DIR, 'media_resize_cache'))
+    max_bytes = getattr(settings, 'MEDIA_RESIZE_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+    if _disk_cache is None or (_disk_cache.directory, _disk_cache.max_bytes) != (directory, max_bytes):
+        _disk_cache = DiskLRUCache(directory, max_bytes)
+    return _disk_cache
+
+
+class key_lock:
+    """Блокировка одного ключа в процессе: одновременные запросы одного варианта ждут первый."""
+
+    def __init__(self, key):
+        self.key = key
+
+    def __enter__(self):
+        with _key_locks_guard:
+            lock, users = _key_locks.get(self.key, (threading.Lock(), 0))
+            _key_locks[self.key] = (lock, users + 1)
+        lock.acquire()
+
+    def __exit__(self, *exc_info):
+        with _key_locks_guard:
+            lock, users = _key_locks[self.key]
+            if users == 1:
+                del _key_locks[self.key]
+            else:
+                _key_locks[self.key] = (lock, users - 1)
+        lock.release()
+
+
+class BrokenImage(Exception):
+    """Исходник не декодируется как изображение."""
+
+
+def resize_image(source_path, width, height, pil_format, options):
+    """Уменьшает изображение, вписывая в width x height с сохранением пропорций; не увеличивает."""
+    with open(source_path, 'rb') as source:
+        try:
+            with PILImage.open(source) as picture:
+                picture.draft('RGB', (width, height))
+                picture = ImageOps.exif_transpose(picture)
+                picture.thumbnail((width, height), PILImage.Resampling.LANCZOS, reducing_gap=3.0)
+                if pil_format == 'JPEG' and picture.mode not in ('RGB', 'L'):
+                    picture = picture.convert('RGB')
+                buffer = io.BytesIO()
+                picture.save(buffer, pil_format, **options)
+        except (OSError, PILImage.DecompressionBombError) as error:
+            # Файл уже открыт, поэтому OSError здесь — нераспознанный формат, обрезанный или повреждённый файл
+            raise BrokenImage(str(error)) from error
+    return buffer.getvalue()
+
+
+def resize_key(source_path, width, height):
+    """Ключ копии: замена исходника меняет его, и в дисковом кэше не остаётся устаревших копий."""
+    stat = os.stat(source_path)
+    return f"{width}x{height}|{source_path}|{stat.st_mtime_ns}|{stat.st_size}"
+
+
+def key_digest(key):
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def get_resized(source_path, width, height, pil_format, options, key=None):
+    """
+    Путь к уменьшенной копии в дисковом кэше. Строит её один раз на все одновременные запросы:
+    в процессе — блокировкой ключа, между процессами — блокировкой в общем кэше, как в cached().
+    """
+    disk_cache = get_disk_cache()
+    if key is None:
+        key = resize_key(source_path, width, height)
+
+    path = disk_cache.get(key)
+    if path is not None:
+        return path
+
+    with key_lock(key):
+        path = disk_cache.get(key)
+        if path is not None:
+            return path
+
+        lock_key = f"media_resize_lock_{key_digest(key)}"
+        locked = cache.add(lock_key, True, timeout=LOCK_TIMEOUT)
+        if not locked:
+            deadline = time.monotonic() + LOCK_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(LOCK_POLL_INTERVAL)
+                path = disk_cache.get(key)
+                if path is not None:
+                    return path
+        try:
+            return disk_cache.set(key, resize_image(source_path, width, height, pil_format, options))
+        finally:
+            if locked:
+                cache.delete(lock_key)
+
+
+def open_resized(source_path, width, height, extension, key, digest):
+    """Открытая уменьшенная копия; Http404, если исходник не читается как изображение."""
+    broken_key = f"media_resize_broken_{digest}"
+    if cache.get(broken_key):
+        raise Http404("Файл не является изображением")
+
+    pil_format, _, options = RESIZE_FORMATS[extension]
+    try:
+        try:
+            return open(get_resized(source_path, width, height, pil_format, options, key), 'rb')
+        except FileNotFoundError:
+            # Копию успел вытеснить другой процесс между проверкой и открытием
+            return open(get_resized(source_path, width, height, pil_format, options, key), 'rb')
+    except FileNotFoundError:
+        raise Http404("Файл не найден")
+    except BrokenImage:
+        # Ошибки дискового кэша (нет места, нет прав) сюда не попадают и остаются ошибками сервера
+        cache.set(broken_key, True, timeout=BROKEN_SOURCE_TIMEOUT)
+        raise Http404("Файл не является изображением")
+
+
+@require_safe
+def media_resize(request, width, height, path):
+    """/media-resize/<w>x<h>/<path>: файл из MEDIA_ROOT, вписанный в w x h; ETag — версия исходника."""
+    max_size = getattr(settings, 'MEDIA_RESIZE_MAX_SIZE', 2560)
+    if not (0 < width <= max_size and 0 < height <= max_size):
+        raise Http404("Недопустимый размер")
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in RESIZE_FORMATS:
+        raise Http404("Неподдерживаемый формат")
+    try:
+        source_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Файл не найден")
+    if not os.path.isfile(source_path):
+        raise Http404("Файл не найден")
+
+    key = resize_key(source_path, width, height)
+    digest = key_digest(key)
+    etag = quote_etag(digest[:32])
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = FileResponse(open_resized(source_path, width, height, extension, key, digest),
+                                content_type=RESIZE_FORMATS[extension][1])
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=RESIZE_MAX_AGE)
+    return response
+
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0043_alter_house_garage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='house',
+            index=models.Index(fields=['price', 'id'], name='backend_hou_price_e7f06a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='house',
+            index=models.Index(fields=['category', 'price', 'id'], name='backend_hou_categor_093481_idx'),
+        ),
+    ]
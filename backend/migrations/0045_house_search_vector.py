@@ -0,0 +1,24 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:40
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0044_house_price_id_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='house',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('title', config='russian', weight='A'), '||', django.contrib.postgres.search.SearchVector('description', config='russian', weight='B'), django.contrib.postgres.search.SearchConfig('russian')), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddIndex(
+            model_name='house',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='backend_hou_search__a4945e_gin'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.3 on 2026-10-18 13:05
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0045_house_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='house',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='house_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
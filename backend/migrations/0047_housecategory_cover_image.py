@@ -0,0 +1,34 @@
+# Generated by Django 5.1.3 on 2026-10-18 14:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def fill_cover_images(apps, schema_editor):
+    HouseCategory = apps.get_model('backend', 'HouseCategory')
+    House = apps.get_model('backend', 'House')
+
+    first_houses = (
+        House.objects.filter(images__isnull=False)
+        .values('category_id').annotate(house_id=Min('id')).values_list('category_id', 'house_id')
+    )
+    for category_id, house_id in first_houses:
+        image_id = House.images.through.objects.filter(house_id=house_id).aggregate(first=Min('image_id'))['first']
+        HouseCategory.objects.filter(id=category_id).update(cover_image_id=image_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0046_house_title_trgm_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='housecategory',
+            name='cover_image',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='backend.image', verbose_name='Обложка'),
+        ),
+        migrations.RunPython(fill_cover_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:40
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0047_housecategory_cover_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HouseCard',
+            fields=[
+                ('house', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='backend.house')),
+                ('title', models.CharField(max_length=100)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('discount_percentage', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('new', models.BooleanField(default=True)),
+                ('best_seller', models.CharField(blank=True, max_length=10, null=True)),
+                ('area', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('floors', models.PositiveIntegerField()),
+                ('rooms', models.PositiveIntegerField()),
+                ('living_area', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('kitchen_area', models.DecimalField(blank=True, decimal_places=2, max_digits=6, null=True)),
+                ('bedrooms', models.PositiveIntegerField()),
+                ('bathrooms', models.PositiveIntegerField(blank=True, null=True)),
+                ('garage', models.IntegerField(blank=True, null=True)),
+                ('purpose', models.CharField(max_length=30)),
+                ('listing', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('card', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='backend.housecategory')),
+                ('construction_technology', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='backend.constructiontechnology')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['price', 'house'], name='backend_hou_price_b15d45_idx'), models.Index(fields=['category', 'price', 'house'], name='backend_hou_categor_57c6ea_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.1.3 on 2026-10-18 17:25
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, When, Case
+from django.db.models.functions import Round
+
+
+def fill_effective_prices(apps, schema_editor):
+    House = apps.get_model('backend', 'House')
+    HouseCard = apps.get_model('backend', 'HouseCard')
+
+    House.objects.update(effective_price=Case(
+        When(discount_percentage__isnull=False,
+             then=Round(F('price') * (1 - F('discount_percentage') / 100), 2)),
+        default=F('price'),
+    ))
+    HouseCard.objects.update(effective_price=Subquery(
+        House.objects.filter(pk=OuterRef('house_id')).values('effective_price')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0048_housecard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='house',
+            name='effective_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10, verbose_name='Цена с учётом скидки'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='housecard',
+            name='effective_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_effective_prices, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='housecard',
+            name='backend_hou_price_b15d45_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='housecard',
+            name='backend_hou_categor_57c6ea_idx',
+        ),
+        migrations.AddIndex(
+            model_name='house',
+            index=models.Index(fields=['effective_price', 'id'], name='backend_hou_effecti_cb30d2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='house',
+            index=models.Index(fields=['category', 'effective_price', 'id'], name='backend_hou_categor_589c7a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='housecard',
+            index=models.Index(fields=['effective_price', 'house'], name='backend_hou_effecti_64b6b0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='housecard',
+            index=models.Index(fields=['category', 'effective_price', 'house'], name='backend_hou_categor_0e2527_idx'),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Прежние связи дома с изображениями и соответствующий им вид
+IMAGE_FIELD_KINDS = (
+    ('images', 'main'),
+    ('interior_images', 'interior'),
+    ('facade_images', 'facade'),
+    ('layout_images', 'layout'),
+)
+
+
+def copy_house_images(apps, schema_editor):
+    House = apps.get_model('backend', 'House')
+    HouseImage = apps.get_model('backend', 'HouseImage')
+
+    for field, kind in IMAGE_FIELD_KINDS:
+        through = getattr(House, field).through
+        positions = {}
+        links = []
+        # Порядок добавления сохраняется в position
+        for house_id, image_id in through.objects.order_by('house_id', 'id').values_list('house_id', 'image_id'):
+            position = positions.get(house_id, 0)
+            positions[house_id] = position + 1
+            links.append(HouseImage(house_id=house_id, image_id=image_id, kind=kind, position=position))
+        HouseImage.objects.bulk_create(links, batch_size=1000)
+
+
+def restore_house_images(apps, schema_editor):
+    House = apps.get_model('backend', 'House')
+    HouseImage = apps.get_model('backend', 'HouseImage')
+
+    for field, kind in IMAGE_FIELD_KINDS:
+        through = getattr(House, field).through
+        through.objects.bulk_create(
+            [through(house_id=house_id, image_id=image_id) for house_id, image_id in
+             HouseImage.objects.filter(kind=kind).order_by('house_id', 'position', 'id')
+             .values_list('house_id', 'image_id')],
+            batch_size=1000, ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0049_house_effective_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HouseImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('main', 'Основное'), ('interior', 'Интерьер'), ('facade', 'Фасад'), ('layout', 'Планировка')], default='main', max_length=10, verbose_name='Вид')),
+                ('position', models.PositiveIntegerField(default=0, verbose_name='Позиция')),
+                ('house', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='house_images', to='backend.house')),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='house_images', to='backend.image')),
+            ],
+            options={
+                'ordering': ['position', 'id'],
+                'indexes': [models.Index(fields=['house', 'kind', 'position'], name='backend_hou_house_i_7c55bd_idx')],
+                'constraints': [models.UniqueConstraint(fields=('house', 'kind', 'image'), name='unique_house_image_kind')],
+            },
+        ),
+        migrations.RunPython(copy_house_images, restore_house_images),
+        migrations.RemoveField(
+            model_name='house',
+            name='images',
+        ),
+        migrations.RemoveField(
+            model_name='house',
+            name='interior_images',
+        ),
+        migrations.RemoveField(
+            model_name='house',
+            name='facade_images',
+        ),
+        migrations.RemoveField(
+            model_name='house',
+            name='layout_images',
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:30
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0051_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='house',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('title'), name='gin_trgm_ops'), name='house_title_upper_trgm_idx'),
+        ),
+    ]
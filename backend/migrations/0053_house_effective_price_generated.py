@@ -0,0 +1,53 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:55
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Round
+
+
+def sync_card_prices(apps, schema_editor):
+    House = apps.get_model('backend', 'House')
+    HouseCard = apps.get_model('backend', 'HouseCard')
+
+    # Цены, сохранённые раньше из Python, округлялись к чётному; колонка теперь считается ROUND() базы
+    HouseCard.objects.update(effective_price=Subquery(
+        House.objects.filter(pk=OuterRef('house_id')).values('effective_price')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0052_house_title_upper_trgm_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='house',
+            name='backend_hou_effecti_cb30d2_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='house',
+            name='backend_hou_categor_589c7a_idx',
+        ),
+        migrations.RemoveField(
+            model_name='house',
+            name='effective_price',
+        ),
+        migrations.AddField(
+            model_name='house',
+            name='effective_price',
+            field=models.GeneratedField(db_persist=True, expression=Round(F('price') * (1 - Coalesce('discount_percentage', Value(Decimal('0'))) / 100), 2), output_field=models.DecimalField(decimal_places=2, max_digits=10), verbose_name='Цена с учётом скидки'),
+        ),
+        migrations.AddIndex(
+            model_name='house',
+            index=models.Index(fields=['effective_price', 'id'], name='backend_hou_effecti_cb30d2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='house',
+            index=models.Index(fields=['category', 'effective_price', 'id'], name='backend_hou_categor_589c7a_idx'),
+        ),
+        migrations.RunPython(sync_card_prices, migrations.RunPython.noop),
+    ]
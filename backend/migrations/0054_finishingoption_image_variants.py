@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0053_house_effective_price_generated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='finishingoption',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0054_finishingoption_image_variants'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='house',
+            name='backend_hou_price_e7f06a_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='house',
+            name='backend_hou_categor_093481_idx',
+        ),
+    ]
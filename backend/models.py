@@ -1,8 +1,15 @@
 import os
-
-from django.db import models
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector, SearchVectorField, SearchQuery, SearchRank
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.utils.functional import cached_property
 from django.utils.text import slugify
-from django.db.models import Count
+from django.db.models import Min, Max, Prefetch, OuterRef, Subquery, F, Value
+from django.db.models.functions import Cast, Coalesce, Round, Upper
 from django.utils import timezone
 
 from auth_app.models import User
@@ -13,6 +20,8 @@ class HouseCategory(models.Model):
     short_description = models.TextField(null=True, blank=True)
     long_description = models.TextField(null=True, blank=True)
     slug = models.SlugField(unique=True, blank=True, db_index=True)
+    cover_image = models.ForeignKey('Image', on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+                                    related_name='+', verbose_name="Обложка")
 
     class Meta:
         verbose_name = "Категория дома"
@@ -30,8 +39,46 @@ class HouseCategory(models.Model):
         return self.name
 
     def get_random_image(self):
-        house_with_images = self.houses.annotate(num_images=Count('images')).filter(num_images__gt=0).first()
-        return house_with_images.images.first().image.url if house_with_images else None
+        return self.cover_image.image.url if self.cover_image else None
+
+    @staticmethod
+    def find_cover_image_ids(category_ids):
+        """
+        Обложка категории — первое изображение первого дома с изображениями.
+        Считается сразу для набора категорий за два запроса: {id категории: id изображения}.
+        """
+        first_houses = dict(
+            House.objects.filter(category_id__in=category_ids, house_images__kind=HouseImage.MAIN)
+            .values('category_id').annotate(house_id=Min('id')).values_list('category_id', 'house_id')
+        )
+        if not first_houses:
+            return {}
+
+        first_images = dict(
+            HouseImage.objects.filter(house_id__in=first_houses.values(), kind=HouseImage.MAIN)
+            .order_by('house_id', 'position', 'id').distinct('house_id').values_list('house_id', 'image_id')
+        )
+        return {category_id: first_images[house_id] for category_id, house_id in first_houses.items()}
+
+    @classmethod
+    def refresh_cover_images(cls, category_ids):
+        """
+        Пересчитывает сохранённые обложки категорий.
+        Возвращает категории, у которых обложка сменилась.
+        """
+        category_ids = {category_id for category_id in category_ids if category_id}
+        if not category_ids:
+            return []
+
+        covers = cls.find_cover_image_ids(category_ids)
+        changed = []
+        for category in cls.objects.filter(id__in=category_ids).only('id', 'slug', 'cover_image'):
+            if category.cover_image_id != covers.get(category.id):
+                category.cover_image_id = covers.get(category.id)
+                changed.append(category)
+
+        cls.objects.bulk_update(changed, ['cover_image'])
+        return changed
 
 
 class ConstructionTechnology(models.Model):
@@ -41,6 +88,92 @@ class ConstructionTechnology(models.Model):
         return self.name
 
 
+class HouseQuerySet(models.QuerySet):
+    # Поля сериализатора, которые вычисляются из нескольких колонок
+    COMPUTED_FIELD_COLUMNS = {
+        'new_price': ('price', 'discount_percentage'),
+        'discount': ('discount_percentage',),
+    }
+
+    # Все виды изображений читаются одним запросом house_images и раскладываются по видам в Python
+    LISTING_RELATIONS = {
+        **{name: lambda: Prefetch('house_images', queryset=HouseImage.objects.select_related('image'))
+           for name in ('images', 'interior_images', 'facade_images', 'layout_images')},
+        'documents': lambda: Prefetch('documents', queryset=Document.objects.all()),
+        'finishing_options_details': lambda: Prefetch('finishing_options', queryset=FinishingOption.objects.all()),
+    }
+
+    LISTING_SELECTS = {
+        'category_details': 'category__cover_image',
+        'construction_technology_details': 'construction_technology',
+    }
+
+    CARD_FIELDS = ('id', 'title', 'price', 'new_price', 'discount', 'area', 'rooms', 'image')
+
+    def search(self, text):
+        """
+        Полнотекстовый поиск по названию и описанию (русская морфология)
+        с оценкой релевантности в поле rank.
+        """
+        query = SearchQuery(text, config='russian', search_type='websearch')
+        # ts_rank возвращает real; double precision нужен, чтобы значение в курсоре пагинации сравнивалось точно
+        rank = Cast(SearchRank(F('search_vector'), query), output_field=models.FloatField())
+        return self.filter(search_vector=query).annotate(rank=rank)
+
+    def only_fields(self, fields):
+        columns = {'id'}
+        for name in fields:
+            if name in self.COMPUTED_FIELD_COLUMNS:
+                columns.update(self.COMPUTED_FIELD_COLUMNS[name])
+            elif name in self.LISTING_SELECTS:
+                columns.add(self.LISTING_SELECTS[name].split('__')[0])
+            elif name not in self.LISTING_RELATIONS:
+                try:
+                    field = self.model._meta.get_field(name)
+                except FieldDoesNotExist:
+                    continue
+                if field.concrete and not field.many_to_many:
+                    columns.add(name)
+        return self.only(*columns)
+
+    def for_listing(self, fields=None):
+        """
+        Общий план запроса для выдачи домов через HouseSerializer:
+        число запросов не зависит от количества домов на странице.
+        Если передан fields, загружаются только нужные колонки и связи.
+        """
+        queryset = self
+        if fields is not None:
+            queryset = queryset.only_fields(fields)
+        else:
+            fields = list(self.LISTING_SELECTS) + list(self.LISTING_RELATIONS)
+
+        selects = [self.LISTING_SELECTS[name] for name in fields if name in self.LISTING_SELECTS]
+        # Несколько полей может читаться одной связью, она загружается один раз
+        prefetches = {}
+        for name in fields:
+            if name in self.LISTING_RELATIONS:
+                prefetch = self.LISTING_RELATIONS[name]()
+                prefetches.setdefault(prefetch.prefetch_to, prefetch)
+        return queryset.select_related(*selects).prefetch_related(*prefetches.values())
+
+    def for_cards(self, fields=None):
+        """
+        Карточка дома для сеток каталога: несколько колонок и обложка
+        (первое изображение) одним подзапросом вместо вложенных списков.
+        """
+        fields = self.CARD_FIELDS if fields is None else [name for name in fields if name in self.CARD_FIELDS]
+        queryset = self.only_fields(fields)
+
+        if 'image' in fields:
+            first_image = (
+                HouseImage.objects.filter(house_id=OuterRef('pk'), kind=HouseImage.MAIN)
+                .order_by('position', 'id').values('image__image')[:1]
+            )
+            queryset = queryset.annotate(cover_image=Subquery(first_image))
+        return queryset
+
+
 class House(models.Model):
     BESTSELLER_CHOICES = [
         ('Акция', 'Акция'),
@@ -55,6 +188,13 @@ class House(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2, db_index=True)
     discount_percentage = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True,
                                               verbose_name="Скидка (%)")
+    # Считается базой, поэтому верна и после QuerySet.update(), bulk_update() и массовых действий админки
+    effective_price = models.GeneratedField(
+        expression=Round(F('price') * (1 - Coalesce('discount_percentage', Value(Decimal('0'))) / 100), 2),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        db_persist=True,
+        verbose_name="Цена с учётом скидки",
+    )
     new = models.BooleanField(default=True, verbose_name="Новый продукт", db_index=True)
     best_seller = models.CharField(max_length=10, choices=BESTSELLER_CHOICES, blank=True, null=True, db_index=True)
     area = models.DecimalField(max_digits=6, decimal_places=2, verbose_name="Площадь, м²", db_index=True)
@@ -72,15 +212,64 @@ class House(models.Model):
     category = models.ForeignKey(HouseCategory, on_delete=models.CASCADE, related_name='houses', db_index=True)
     description = models.TextField(verbose_name="Описание", null=True, blank=True)
     finishing_options = models.ManyToManyField('FinishingOption', through='HouseFinishing', related_name='houses', db_index=True)
-    images = models.ManyToManyField('Image', related_name='houses', blank=True)
-    interior_images = models.ManyToManyField('Image', related_name='interior_houses', blank=True)
-    facade_images = models.ManyToManyField('Image', related_name='facade_houses', blank=True)
-    layout_images = models.ManyToManyField('Image', related_name='layout_houses', blank=True)
     documents = models.ManyToManyField('Document', related_name='houses', blank=True)
+    search_vector = models.GeneratedField(
+        expression=SearchVector('title', weight='A', config='russian')
+        + SearchVector('description', weight='B', config='russian'),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    objects = HouseQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['effective_price', 'id']),
+            models.Index(fields=['category', 'effective_price', 'id']),
+            GinIndex(fields=['search_vector']),
+            GinIndex(fields=['title'], opclasses=['gin_trgm_ops'], name='house_title_trgm_idx'),
+            # title__icontains в Postgres — UPPER(title) LIKE UPPER(...): без этого индекса подсказки читают всю таблицу
+            GinIndex(OpClass(Upper('title'), name='gin_trgm_ops'), name='house_title_upper_trgm_idx'),
+        ]
 
     def __str__(self):
         return f"Дом {self.pk} - {self.price} руб."
 
+    def save(self, *args, **kwargs):
+        # UPDATE не возвращает вычисленные базой колонки, а обработчики post_save (индекс каталога,
+        # карточки) читают цену с экземпляра: считаем её до сохранения так же, как в effective_price
+        self.effective_price = self.calculate_effective_price()
+        super().save(*args, **kwargs)
+
+    def calculate_effective_price(self):
+        """Цена, которую платит покупатель: со скидкой, если она есть. Округление как у ROUND() в Postgres."""
+        price = Decimal(str(self.price))
+        if self.discount_percentage:
+            price *= 1 - Decimal(str(self.discount_percentage)) / 100
+        return price.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+    @cached_property
+    def images_by_kind(self):
+        """Изображения дома по видам {вид: [Image]} в порядке position; после for_listing — без запросов."""
+        images = {kind: [] for kind, _ in HouseImage.KIND_CHOICES}
+        for house_image in self.house_images.all():
+            images[house_image.kind].append(house_image.image)
+        return images
+
+    def add_images(self, kind, images):
+        """Добавляет изображения вида kind в конец списка этого вида."""
+        # Одна транзакция — одна пересборка карточки дома, а не по одной на изображение
+        with transaction.atomic():
+            last = self.house_images.filter(kind=kind).aggregate(last=Max('position'))['last']
+            start = 0 if last is None else last + 1
+            for offset, image in enumerate(images):
+                HouseImage.objects.create(house=self, image=image, kind=kind, position=start + offset)
+        self.__dict__.pop('images_by_kind', None)
+
+    def remove_images(self, kind, images):
+        self.house_images.filter(kind=kind, image__in=images).delete()
+        self.__dict__.pop('images_by_kind', None)
+
     @property
     def new_price(self):
         if self.discount_percentage:
@@ -94,8 +283,84 @@ class House(models.Model):
         return None
 
 
+class HouseCard(models.Model):
+    """
+    Денормализованная запись дома для списков каталога: копии колонок House для фильтров
+    и сортировки и готовые данные HouseSerializer (listing) и HouseCardSerializer (card).
+    Список читается одним запросом к этой таблице. Поддерживается сигналами, см. house_cards.py.
+    """
+    HOUSE_FIELDS = (
+        'title', 'price', 'discount_percentage', 'effective_price', 'new', 'best_seller', 'area', 'floors', 'rooms',
+        'living_area', 'kitchen_area', 'bedrooms', 'bathrooms', 'garage', 'purpose',
+        'construction_technology', 'category',
+    )
+
+    house = models.OneToOneField(House, on_delete=models.CASCADE, primary_key=True, related_name='card')
+    title = models.CharField(max_length=100)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    discount_percentage = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2)
+    new = models.BooleanField(default=True)
+    best_seller = models.CharField(max_length=10, blank=True, null=True)
+    area = models.DecimalField(max_digits=6, decimal_places=2)
+    floors = models.PositiveIntegerField()
+    rooms = models.PositiveIntegerField()
+    living_area = models.DecimalField(max_digits=6, decimal_places=2)
+    kitchen_area = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
+    bedrooms = models.PositiveIntegerField()
+    bathrooms = models.PositiveIntegerField(null=True, blank=True)
+    garage = models.IntegerField(null=True, blank=True)
+    purpose = models.CharField(max_length=30)
+    construction_technology = models.ForeignKey(ConstructionTechnology, on_delete=models.CASCADE, related_name='+')
+    category = models.ForeignKey(HouseCategory, on_delete=models.CASCADE, related_name='+')
+    listing = models.JSONField(encoder=DjangoJSONEncoder)
+    card = models.JSONField(encoder=DjangoJSONEncoder)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['effective_price', 'house']),
+            models.Index(fields=['category', 'effective_price', 'house']),
+        ]
+
+    def __str__(self):
+        return f"Карточка дома {self.house_id}"
+
+
 class Image(models.Model):
     image = models.ImageField(upload_to='house_images/')
+    # Уменьшенные копии {ширина: {формат: имя файла}}, заполняются в фоне, см. image_variants.py
+    variants = models.JSONField(default=dict, blank=True, editable=False)
+
+
+class HouseImage(models.Model):
+    """Изображение дома: вид (основное, интерьер, фасад, планировка) и место в списке своего вида."""
+    MAIN, INTERIOR, FACADE, LAYOUT = 'main', 'interior', 'facade', 'layout'
+    KIND_CHOICES = [
+        (MAIN, 'Основное'),
+        (INTERIOR, 'Интерьер'),
+        (FACADE, 'Фасад'),
+        (LAYOUT, 'Планировка'),
+    ]
+    # Поля HouseSerializer и загружаемых файлов для каждого вида
+    FIELD_KINDS = {'images': MAIN, 'interior_images': INTERIOR, 'facade_images': FACADE, 'layout_images': LAYOUT}
+
+    house = models.ForeignKey(House, on_delete=models.CASCADE, related_name='house_images')
+    image = models.ForeignKey(Image, on_delete=models.CASCADE, related_name='house_images')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=MAIN, verbose_name="Вид")
+    position = models.PositiveIntegerField(default=0, verbose_name="Позиция")
+
+    class Meta:
+        ordering = ['position', 'id']
+        indexes = [
+            models.Index(fields=['house', 'kind', 'position']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['house', 'kind', 'image'], name='unique_house_image_kind'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.position} дома {self.house_id}"
 
 
 class FinishingOption(models.Model):
@@ -103,6 +368,8 @@ class FinishingOption(models.Model):
     description = models.TextField(verbose_name="Описание")
     price_per_sqm = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Цена за м²", null=True, blank=True)
     image = models.ImageField(upload_to='houses/finishing_options/', verbose_name='Изображение', null=True, blank=True)
+    # Уменьшенные копии image в том же виде, что Image.variants
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.description} - {self.price_per_sqm} ₽ за м²"
@@ -293,6 +560,8 @@ class Blog(models.Model):
     content = models.TextField(verbose_name="Содержимое")
     date = models.DateTimeField(auto_now_add=True, verbose_name="Дата публикации")
     image = models.ImageField(upload_to='blog/', verbose_name="Изображение")
+    # Уменьшенные копии image в том же виде, что Image.variants
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     category = models.ForeignKey(BlogCategory, on_delete=models.CASCADE, related_name="blogs", verbose_name="Категория")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, verbose_name="Статус строительства")
 
@@ -0,0 +1,55 @@
+from django.conf import settings
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer на orjson. Вывод совпадает с рендерером DRF: типы, которые orjson не знает
+    (Decimal, ленивые строки перевода, QuerySet), и даты кодируются энкодером DRF.
+    Без orjson и для запросов с indent работает обычный рендерер.
+    """
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.ensure_ascii or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        content = orjson.dumps(data, default=self.encoder.default,
+                               option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+        # Как и DRF, экранируем разделители строк, чтобы ответ оставался валидным JavaScript
+        return content.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser на orjson для тел запросов в UTF-8."""
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+def get_json_renderer():
+    """Первый JSON-рендерер из DEFAULT_RENDERER_CLASSES — тот, которым API отвечает по умолчанию."""
+    for renderer_class in api_settings.DEFAULT_RENDERER_CLASSES:
+        if renderer_class.format == 'json':
+            return renderer_class()
+    return renderers.JSONRenderer()
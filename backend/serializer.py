@@ -9,6 +9,20 @@ from .models import House, ConstructionTechnology, HouseCategory \
     FilterOption, UserQuestionHouse, UserQuestion, HouseFinishing, Image, BlogCategory, Blog, ReviewFile
 
 
+class SparseFieldsMixin:
+    """
+    Позволяет ограничить набор полей: Serializer(..., fields=['id', 'title']).
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
 class ConstructionTechnologySerializer(serializers.ModelSerializer):
     class Meta:
         model = ConstructionTechnology
@@ -26,10 +40,20 @@ class HouseCategorySerializer(serializers.ModelSerializer):
         return obj.get_random_image()
 
 
+def variant_urls(storage, variants):
+    """URL уменьшенных копий по ширине: {"640": {"webp": url, "jpeg": url}}; пусто, пока они строятся."""
+    return {width: {fmt: storage.url(name) for fmt, name in formats.items()} for width, formats in variants.items()}
+
+
 class FinishingOptionSerializer(serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = FinishingOption
-        fields = ['id', 'title', 'description', 'image', 'price_per_sqm']
+        fields = ['id', 'title', 'description', 'image', 'image_variants', 'price_per_sqm']
+
+    def get_image_variants(self, obj):
+        return variant_urls(obj.image.storage, obj.image_variants) if obj.image else {}
 
     def create(self, validated_data):
         return FinishingOption.objects.create(**validated_data)
@@ -63,19 +87,24 @@ class DocumentSerializer(serializers.ModelSerializer):
 
 class ImageSerializer(serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
+    variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Image
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'variants']
 
     def get_image(self, obj):
         return obj.image.url if obj.image else None
 
-class HouseSerializer(serializers.ModelSerializer):
-    images = ImageSerializer(many=True, required=False)
-    interior_images = ImageSerializer(many=True, required=False)
-    facade_images = ImageSerializer(many=True, required=False)
-    layout_images = ImageSerializer(many=True, required=False)
+    def get_variants(self, obj):
+        return variant_urls(obj.image.storage, obj.variants)
+
+class HouseSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # Все изображения дома приходят одной связью house_images и раскладываются по видам в House.images_by_kind
+    images = ImageSerializer(many=True, required=False, source='images_by_kind.main')
+    interior_images = ImageSerializer(many=True, required=False, source='images_by_kind.interior')
+    facade_images = ImageSerializer(many=True, required=False, source='images_by_kind.facade')
+    layout_images = ImageSerializer(many=True, required=False, source='images_by_kind.layout')
     documents = DocumentSerializer(many=True, required=False)
     new_price = serializers.SerializerMethodField()
     discount = serializers.SerializerMethodField()
@@ -116,7 +145,7 @@ class HouseSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = House
-        fields = '__all__'
+        exclude = ['search_vector']
 
     def validate_best_seller(self, value):
         if value in [None, '', 'null']:
@@ -126,27 +155,15 @@ class HouseSerializer(serializers.ModelSerializer):
         return value
 
     def create(self, validated_data):
-        images_data = validated_data.pop('images', [])
-        interior_images_data = validated_data.pop('interior_images', [])
-        facade_images_data = validated_data.pop('facade_images', [])
-        layout_images_data = validated_data.pop('layout_images', [])
+        images_data = validated_data.pop('images_by_kind', {})
         finishing_options = validated_data.pop('finishing_options', [])
         documents_data = validated_data.pop('documents', [])
 
 
         house = House.objects.create(**validated_data)
 
-        for image_data in images_data:
-            house.images.add(Image.objects.create(image=image_data['image']))
-
-        for image_data in interior_images_data:
-            house.interior_images.add(Image.objects.create(image=image_data['image']))
-
-        for image_data in facade_images_data:
-            house.facade_images.add(Image.objects.create(image=image_data['image']))
-
-        for image_data in layout_images_data:
-            house.layout_images.add(Image.objects.create(image=image_data['image']))
+        for kind, kind_images_data in images_data.items():
+            house.add_images(kind, [Image.objects.create(image=image_data['image']) for image_data in kind_images_data])
 
         if finishing_options:
             house.finishing_options.set(finishing_options)
@@ -156,6 +173,26 @@ class HouseSerializer(serializers.ModelSerializer):
 
         return house
 
+class HouseCardSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    new_price = serializers.SerializerMethodField()
+    discount = serializers.SerializerMethodField()
+    image = serializers.SerializerMethodField()
+
+    class Meta:
+        model = House
+        fields = ['id', 'title', 'price', 'new_price', 'discount', 'area', 'rooms', 'image']
+
+    def get_new_price(self, obj):
+        return round(obj.new_price) if obj.new_price else None
+
+    def get_discount(self, obj):
+        return obj.discount
+
+    def get_image(self, obj):
+        cover_image = getattr(obj, 'cover_image', None)
+        return Image._meta.get_field('image').storage.url(cover_image) if cover_image else None
+
+
 class FilterOptionsSerializer(serializers.ModelSerializer):
     class Meta:
         model = FilterOption
@@ -474,11 +511,16 @@ class BlogSerializer(serializers.ModelSerializer):
         queryset=BlogCategory.objects.all(), source='category', write_only=True
     )
     image = serializers.ImageField(use_url=True, required=False)
+    image_variants = serializers.SerializerMethodField()
     date = serializers.DateTimeField(required=False)
 
     class Meta:
         model = Blog
-        fields = ['id', 'title', 'description', 'date', 'image', 'content', 'status', 'category', 'category_id']
+        fields = ['id', 'title', 'description', 'date', 'image', 'image_variants', 'content', 'status', 'category',
+                  'category_id']
+
+    def get_image_variants(self, obj):
+        return variant_urls(obj.image.storage, obj.image_variants) if obj.image else {}
 
 
 
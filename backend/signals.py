@@ -1,41 +1,179 @@
-from django.db.models.signals import post_save, post_delete, pre_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete, m2m_changed
 from django.dispatch import receiver
-from django.core.cache import cache
 
 from auth_app.models import User
 from mail_service.views import send_notification_to_user
-from .models import House, FinishingOption, HouseCategory, PurchasedHouse, Review, Order, UserQuestionHouse
+from .cache import invalidate_tags
+from .catalog_index import index_house_saved, index_house_deleted
+from .filters import reset_filter_plan
+from .house_cards import schedule_house_cards
+from .image_variants import schedule_variants
+from .models import House, FinishingOption, HouseCategory, PurchasedHouse, Review, Order, UserQuestionHouse, \
+    FilterOption, Image, HouseImage, ConstructionTechnology, Document, Blog, BlogCategory
+
+# Связь дома со справочником, по которой находятся карточки для пересборки
+REFERENCE_LOOKUPS = {
+    FinishingOption: 'finishing_options',
+    ConstructionTechnology: 'construction_technology',
+    Document: 'documents',
+}
 
 
 @receiver(post_save, sender=House)
+def update_catalog_index(sender, instance, **kwargs):
+    index_house_saved(instance)
+
 @receiver(post_delete, sender=House)
-def clear_house_cache(sender, instance, **kwargs):
-    cache_key = f"house_detail_{instance.id}"
-    cache.delete(cache_key)
+def remove_from_catalog_index(sender, instance, **kwargs):
+    index_house_deleted(instance)
 
 @receiver(post_save, sender=FinishingOption)
 @receiver(post_delete, sender=FinishingOption)
-def clear_finishing_option_cache(sender, instance, **kwargs):
-    cache.delete("finishing_options_list")
-    cache.delete(f"finishing_option_{instance.id}")
+@receiver(post_save, sender=ConstructionTechnology)
+@receiver(post_delete, sender=ConstructionTechnology)
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Document)
+def clear_house_references_cache(sender, instance, signal, **kwargs):
+    invalidate_tags('house_references', 'catalog')
+    if signal is post_delete:
+        # Связи с домами к этому моменту уже удалены каскадом
+        schedule_house_cards()
+    else:
+        schedule_house_cards(House.objects.filter(**{REFERENCE_LOOKUPS[sender]: instance}).values_list('pk', flat=True))
+
+@receiver(post_save, sender=FilterOption)
+@receiver(post_delete, sender=FilterOption)
+def rebuild_filter_plan(sender, instance, **kwargs):
+    invalidate_tags('filter_options', 'catalog')
+    reset_filter_plan()
+    transaction.on_commit(reset_filter_plan)
 
 @receiver(post_save, sender=HouseCategory)
 @receiver(post_delete, sender=HouseCategory)
 def clear_house_category_cache(sender, instance, **kwargs):
-    cache.delete(f"house_category_{instance.slug}")
-    cache.delete("house_category_list")
+    invalidate_tags(f"category:{instance.id}", 'categories', 'catalog')
+    schedule_house_cards((), {instance.id})
+
+
+_house_old_category = {}
+_relation_clear_houses = {}
+_image_cover_categories = {}
+
+def clear_houses_cache(house_ids, category_ids):
+    invalidate_tags(
+        'catalog',
+        *(f"house:{house_id}" for house_id in house_ids),
+        *(f"category:{category_id}" for category_id in category_ids if category_id),
+    )
+    schedule_house_cards(house_ids)
+
+def refresh_category_covers(category_ids):
+    changed = HouseCategory.refresh_cover_images(category_ids)
+    if changed:
+        invalidate_tags('categories', 'catalog', *(f"category:{category.id}" for category in changed))
+        schedule_house_cards((), {category.id for category in changed})
+
+def related_house_ids(through, instance):
+    field = next(field for field in through._meta.fields if field.related_model is type(instance))
+    return set(through.objects.filter(**{field.name: instance}).values_list('house_id', flat=True))
+
+@receiver(pre_save, sender=House)
+def cache_old_house_category(sender, instance, **kwargs):
+    if instance.pk:
+        _house_old_category[instance.pk] = (
+            sender.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+        )
+
+@receiver(post_save, sender=House)
+def clear_house_cache_on_save(sender, instance, created, **kwargs):
+    old_category_id = _house_old_category.pop(instance.pk, None)
+    category_ids = {old_category_id, instance.category_id}
+    clear_houses_cache({instance.pk}, category_ids)
+    if not created and old_category_id != instance.category_id:
+        refresh_category_covers(category_ids)
+
+@receiver(post_delete, sender=House)
+def clear_house_cache_on_delete(sender, instance, **kwargs):
+    clear_houses_cache({instance.pk}, {instance.category_id})
+    refresh_category_covers({instance.category_id})
+
+@receiver(m2m_changed, sender=House.documents.through)
+@receiver(m2m_changed, sender=House.finishing_options.through)
+def clear_house_cache_on_relations_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        _relation_clear_houses[(sender, instance.pk)] = related_house_ids(sender, instance)
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        house_ids, category_ids = {instance.pk}, {instance.category_id}
+    else:
+        house_ids = _relation_clear_houses.pop((sender, instance.pk), set()) if action == 'post_clear' else pk_set
+        category_ids = set(House.objects.filter(pk__in=house_ids).values_list('category_id', flat=True))
+
+    clear_houses_cache(house_ids, category_ids)
+
+@receiver(post_save, sender=HouseImage)
+@receiver(post_delete, sender=HouseImage)
+def clear_house_cache_on_image_change(sender, instance, **kwargs):
+    # Срабатывает и при каскадном удалении вместе с изображением
+    category_ids = set(House.objects.filter(pk=instance.house_id).values_list('category_id', flat=True))
+    clear_houses_cache({instance.house_id}, category_ids)
+    if instance.kind == HouseImage.MAIN:
+        refresh_category_covers(category_ids)
+
+def store_image_variants(image_id, variants):
+    # Вызывается из пула потоков после построения вариантов: данные домов с этим изображением устарели
+    Image.objects.filter(pk=image_id).update(variants=variants)
+    house_ids = set(HouseImage.objects.filter(image_id=image_id).values_list('house_id', flat=True))
+    clear_houses_cache(house_ids, set(House.objects.filter(pk__in=house_ids).values_list('category_id', flat=True)))
+
+@receiver(post_save, sender=Image)
+def build_image_variants(sender, instance, **kwargs):
+    schedule_variants(instance.image, lambda variants: store_image_variants(instance.pk, variants))
+
+def store_finishing_option_variants(option_id, variants):
+    # Отделка входит в данные домов: как и в store_image_variants, устаревают их кэш и карточки
+    FinishingOption.objects.filter(pk=option_id).update(image_variants=variants)
+    invalidate_tags('house_references', 'catalog')
+    schedule_house_cards(House.objects.filter(finishing_options=option_id).values_list('pk', flat=True))
+
+@receiver(post_save, sender=FinishingOption)
+def build_finishing_option_variants(sender, instance, **kwargs):
+    schedule_variants(instance.image, lambda variants: store_finishing_option_variants(instance.pk, variants))
+
+def store_blog_variants(blog_id, variants):
+    Blog.objects.filter(pk=blog_id).update(image_variants=variants)
+    invalidate_tags('blog')
+
+@receiver(post_save, sender=Blog)
+def build_blog_variants(sender, instance, **kwargs):
+    schedule_variants(instance.image, lambda variants: store_blog_variants(instance.pk, variants))
+
+@receiver(pre_delete, sender=Image)
+def cache_image_cover_categories(sender, instance, **kwargs):
+    _image_cover_categories[instance.pk] = set(
+        HouseCategory.objects.filter(cover_image=instance).values_list('id', flat=True)
+    )
+
+@receiver(post_delete, sender=Image)
+def clear_image_cache(sender, instance, **kwargs):
+    invalidate_tags('house_references', 'catalog')
+    refresh_category_covers(_image_cover_categories.pop(instance.pk, set()))
+
+@receiver(post_save, sender=Blog)
+@receiver(post_delete, sender=Blog)
+@receiver(post_save, sender=BlogCategory)
+@receiver(post_delete, sender=BlogCategory)
+def clear_blog_cache(sender, instance, **kwargs):
+    invalidate_tags('blog')
 
 @receiver(post_save, sender=PurchasedHouse)
 @receiver(post_delete, sender=PurchasedHouse)
 def clear_purchase_house_cache(sender, instance, **kwargs):
-    cache.delete(f"purchase_house_{instance.pk}")
-    cache.delete("purchase_house_list")
-
-@receiver(post_save, sender=Review)
-@receiver(post_delete, sender=Review)
-def clear_reviews_cache(sender, instance, **kwargs):
-    cache.delete(f"review_{instance.pk}")
-    cache.delete("reviews_list")
+    invalidate_tags(f"purchase:{instance.pk}")
 
 
 _order_old_status = {}
@@ -1,3 +1,984 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+from base64 import b64encode
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import quote
 
-# Create your tests here.
+import brotli
+from PIL import Image as PILImage
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection, transaction
+from django.db.models.signals import post_delete
+from django.http import QueryDict
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import http_date
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from auth_app.models import User
+
+from . import catalog_index
+from .cache import cache_stats
+from .cache_backends import TieredCache
+from .catalog_index import CatalogIndex
+from .filters import reset_filter_plan
+from .house_cards import build_house_cards, flush_house_cards
+from .image_variants import build_variants, variant_name
+from .media_resize import DiskLRUCache, get_resized
+from .models import House, HouseCategory, ConstructionTechnology, FinishingOption, Image, Document, FilterOption, \
+    HouseCard, HouseImage, Blog
+from .renderers import FastJSONParser, FastJSONRenderer
+from .serializer import BlogSerializer, HouseSerializer
+from .utils import make_cache_key
+from .views import HouseSuggestView
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def create_house(category, technology, **kwargs):
+    data = {
+        'title': 'Дом',
+        'price': 3_000_000,
+        'area': 120,
+        'floors': 2,
+        'rooms': 4,
+        'living_area': 90,
+        'bedrooms': 3,
+        'purpose': 'Частный дом',
+        'construction_technology': technology,
+        'category': category,
+    }
+    data.update(kwargs)
+    return House.objects.create(**data)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class CatalogTestCase(TestCase):
+    """Каталог из трёх категорий по четыре дома со всеми связями."""
+
+    @classmethod
+    def setUpTestData(cls):
+        technology = ConstructionTechnology.objects.create(name='Каркас')
+        finishing = FinishingOption.objects.create(title='Белая', description='Белая отделка', price_per_sqm=1000)
+        document = Document.objects.create(file=SimpleUploadedFile('plan.docx', b'plan'))
+
+        for category_index in range(3):
+            category = HouseCategory.objects.create(name=f'Категория {category_index}')
+            for house_index in range(4):
+                house = create_house(category, technology, title=f'Дом {category_index}-{house_index}',
+                                     price=1_000_000 + house_index, discount_percentage=10)
+                house.add_images(HouseImage.MAIN, [
+                    Image.objects.create(image=f'house_images/{category_index}-{house_index}.jpg'),
+                    Image.objects.create(image=f'house_images/{category_index}-{house_index}-2.jpg'),
+                ])
+                house.add_images(HouseImage.INTERIOR, [Image.objects.create(image='house_images/interior.jpg')])
+                house.add_images(HouseImage.FACADE, [Image.objects.create(image='house_images/facade.jpg')])
+                house.add_images(HouseImage.LAYOUT, [Image.objects.create(image='house_images/layout.jpg')])
+                house.documents.add(document)
+                house.finishing_options.add(finishing)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        reset_filter_plan()
+        self.client.get('/houses/')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response
+
+    def walk_cursor(self, url, direction):
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            pages.append(data)
+            url = data[direction]
+        return pages
+
+
+class HouseListQueryBudgetTests(CatalogTestCase):
+    def test_house_list_query_count_does_not_depend_on_page_size(self):
+        small, _ = self.count_queries('/houses/?page_size=2')
+        large, response = self.count_queries('/houses/?page_size=12')
+
+        self.assertEqual(len(response.json()['results']), 12)
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, 8)
+
+    def test_house_list_with_limit_query_budget(self):
+        with self.assertNumQueries(4):
+            self.client.get('/houses/?limit=12')
+
+    def test_filtered_and_category_lists_query_count_does_not_depend_on_size(self):
+        filtered_small, _ = self.count_queries('/houses/filter/?price_max=1000001')
+        filtered_large, response = self.count_queries('/houses/filter/')
+        self.assertEqual(len(response.json()), 12)
+        self.assertEqual(filtered_small, filtered_large)
+
+        category = HouseCategory.objects.first()
+        _, response = self.count_queries(f'/houses/categories/{category.slug}/')
+        self.assertEqual(len(response.json()['houses']), 4)
+
+
+class FilterPlanTests(CatalogTestCase):
+    def test_filter_plan_is_rebuilt_when_filter_options_change(self):
+        house = House.objects.order_by('id').first()
+        House.objects.filter(pk=house.pk).update(floors=1)
+        self.assertEqual(self.client.get('/houses/?floors=1').json()['count'], 12)
+
+        option = FilterOption.objects.create(name='Этажи', field_name='floors', filter_type='exact')
+        response = self.client.get('/houses/?floors=1')
+        self.assertEqual([item['id'] for item in response.json()['results']], [house.pk])
+
+        option.field_name = 'rooms'
+        option.save()
+        self.assertEqual(self.client.get('/houses/?floors=1').json()['count'], 12)
+        self.assertEqual(self.client.get('/houses/?rooms=5').json()['count'], 0)
+
+        option.delete()
+        self.assertEqual(self.client.get('/houses/?rooms=5').json()['count'], 12)
+
+
+class KeysetPaginationTests(CatalogTestCase):
+    def test_keyset_pagination_walks_both_ways_in_sort_order(self):
+        for sort, ordering in (('priceAsc', ('effective_price', 'id')), ('priceDesc', ('-effective_price', '-id'))):
+            expected = list(House.objects.order_by(*ordering).values_list('id', flat=True))
+
+            forward = self.walk_cursor(f'/houses/?pagination=cursor&page_size=5&sort={sort}', 'next')
+            self.assertEqual([len(page['results']) for page in forward], [5, 5, 2])
+            self.assertIsNone(forward[0]['previous'])
+            self.assertEqual([item['id'] for page in forward for item in page['results']], expected)
+
+            backward = self.walk_cursor(forward[-1]['previous'], 'previous')
+            self.assertEqual([page['results'] for page in reversed(backward)],
+                             [page['results'] for page in forward[:-1]])
+            self.assertIsNotNone(backward[-1]['next'])
+
+    def test_keyset_pagination_rejects_invalid_cursor(self):
+        for cursor in ({'v': ['abc', 'x']}, {'v': [None, 1]}, {'v': ['1']}, 'garbage'):
+            encoded = b64encode(json.dumps(cursor).encode()).decode() if isinstance(cursor, dict) else cursor
+            response = self.client.get('/houses/', {'pagination': 'cursor', 'cursor': encoded})
+            self.assertEqual(response.status_code, 404)
+
+    def test_keyset_pagination_with_sparse_fields_does_not_load_deferred_columns(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/houses/?pagination=cursor&view=card&fields=id,title&page_size=5')
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'title'})
+        self.assertIsNotNone(response.json()['next'])
+
+
+class HouseFacetsTests(CatalogTestCase):
+    def test_facets_count_values_and_ranges_for_active_filters(self):
+        first, second, _, last = House.objects.filter(category=HouseCategory.objects.first()).order_by('price')
+        House.objects.filter(pk=first.pk).update(floors=1, title='Кирпичный дом')
+        House.objects.filter(pk=second.pk).update(title='Кирпичный коттедж')
+        House.objects.filter(pk=last.pk).update(floors=1, title='Каркасный дом')
+        FilterOption.objects.create(name='Этажи', field_name='floors', filter_type='exact')
+
+        data = self.client.get('/houses/facets/').json()
+        self.assertEqual(data['count'], 12)
+        self.assertEqual(data['facets']['floors'], [{'value': 1, 'count': 2}, {'value': 2, 'count': 10}])
+        self.assertEqual(data['facets']['construction_technology'][0]['count'], 12)
+        self.assertEqual(data['ranges']['price'], {'min': 1_000_000, 'max': 1_000_003})
+
+        data = self.client.get('/houses/facets/?floors=1').json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['facets']['floors'], [{'value': 1, 'count': 2}])
+        self.assertEqual(data['ranges']['effective_price'], {'min': 900_000, 'max': 900_002.7})
+
+        data = self.client.get('/houses/facets/?search=кирпичные').json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['facets']['floors'], [{'value': 1, 'count': 1}, {'value': 2, 'count': 1}])
+        self.assertEqual(data['ranges']['price'], {'min': 1_000_000, 'max': 1_000_001})
+
+        data = self.client.get('/houses/facets/?search=кирпичные&floors=1&sort=priceDesc').json()
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['ranges']['price'], {'min': 1_000_000, 'max': 1_000_000})
+
+
+class HouseSearchTests(CatalogTestCase):
+    def test_search_matches_word_forms_and_pages_by_relevance(self):
+        houses = list(House.objects.order_by('id'))
+        for house in houses[:3]:
+            House.objects.filter(pk=house.pk).update(title=f'Кирпичный дом {house.pk}')
+        for house in houses[3:5]:
+            House.objects.filter(pk=house.pk).update(description='Стены кирпичные, перекрытия деревянные')
+        House.objects.filter(pk=houses[5].pk).update(description='Кирпич на фасаде')
+
+        expected = list(House.objects.search('кирпичные').order_by('-rank', 'id').values_list('id', flat=True))
+        self.assertEqual(set(expected), {house.pk for house in houses[:5]})
+        self.assertEqual(set(expected[:3]), {house.pk for house in houses[:3]})
+
+        response = self.client.get('/houses/?search=кирпичные')
+        self.assertEqual([item['id'] for item in response.json()['results']], expected)
+
+        # Ссылки курсора строятся из строки запроса, поэтому она кодируется так же, как в браузере
+        pages = self.walk_cursor(f"/houses/?search={quote('кирпичные')}&pagination=cursor&page_size=2", 'next')
+        self.assertEqual([item['id'] for page in pages for item in page['results']], expected)
+        backward = self.walk_cursor(pages[-1]['previous'], 'previous')
+        self.assertEqual([item['id'] for page in reversed(backward) for item in page['results']], expected[:4])
+
+    def test_suggest_returns_best_title_matches(self):
+        first, second, third = House.objects.order_by('id')[:3]
+        House.objects.filter(pk=first.pk).update(title='Кирпичный дом')
+        House.objects.filter(pk=second.pk).update(title='Кирпичный коттедж')
+        House.objects.filter(pk=third.pk).update(title='Каркасный дом')
+
+        response = self.client.get('/houses/suggest/', {'q': 'кирпич'})
+        self.assertEqual({item['id'] for item in response.json()}, {first.pk, second.pk})
+        self.assertEqual(set(response.json()[0]), {'id', 'title', 'price', 'effective_price'})
+        self.assertIn('max-age=60', response['Cache-Control'])
+
+        self.assertEqual(self.client.get('/houses/suggest/', {'q': 'коттедж'}).json()[0]['id'], second.pk)
+        self.assertEqual({item['id'] for item in self.client.get('/houses/suggest/', {'q': 'кирпчный'}).json()},
+                         {first.pk, second.pk})
+        self.assertEqual(len(self.client.get('/houses/suggest/', {'q': 'дом', 'limit': 2}).json()), 2)
+        self.assertEqual(self.client.get('/houses/suggest/', {'q': 'к'}).json(), [])
+
+    def test_suggest_query_reads_trigram_indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                self.skipTest('Нет расширения pg_trgm')
+            # На дюжине строк планировщик и так выберет полный проход: при его запрете остаются
+            # только битмап-сканирования по условиям, то есть по индексам триграмм
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_indexscan = off')
+        plan = HouseSuggestView().get_queryset('кирпич')[:8].explain()
+        self.assertNotIn('Seq Scan on backend_house', plan)
+        self.assertIn('house_title_upper_trgm_idx', plan)
+        self.assertIn('house_title_trgm_idx', plan)
+
+
+class CatalogIndexTests(CatalogTestCase):
+    def catalog_responses(self, urls):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            responses = [self.client.get(url).json() for url in urls]
+        return responses, [query['sql'] for query in context.captured_queries]
+
+    def test_catalog_index_results_match_database_queries(self):
+        house = House.objects.order_by('id').first()
+        House.objects.filter(pk=house.pk).update(floors=1)
+        FilterOption.objects.create(name='Этажи', field_name='floors', filter_type='exact')
+        FilterOption.objects.create(name='Цена', field_name='effective_price', filter_type='range')
+        urls = ('/houses/?page_size=12', '/houses/?sort=priceDesc&page_size=5&page=2', '/houses/?floors=1',
+                f"/houses/?category={quote('Категория 1')}&sort=priceAsc",
+                '/houses/?effective_price__gte=900001&sort=priceDesc', '/houses/filter/?price_max=900001')
+
+        expected, _ = self.catalog_responses(urls)
+        with override_settings(CATALOG_INDEX_ENABLED=True), mock.patch.object(catalog_index, '_index', CatalogIndex()):
+            indexed, queries = self.catalog_responses(urls)
+
+        # /houses/filter/ не сортируется
+        self.assertEqual(sorted(indexed.pop(), key=lambda item: item['id']),
+                         sorted(expected.pop(), key=lambda item: item['id']))
+        self.assertEqual(indexed, expected)
+        self.assertEqual(expected[2]['count'], 1)
+        self.assertFalse([sql for sql in queries if '"backend_house"."floors" =' in sql])
+
+    @override_settings(CATALOG_INDEX_ENABLED=True)
+    def test_catalog_index_follows_saved_and_deleted_houses(self):
+        with mock.patch.object(catalog_index, '_index', CatalogIndex()) as index:
+            self.client.get('/houses/')
+            house = House.objects.order_by('id').last()
+            with self.captureOnCommitCallbacks(execute=True):
+                house.price = 10
+                house.save()
+            self.assertEqual(self.client.get('/houses/?sort=priceAsc').json()['results'][0]['id'], house.pk)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                created = create_house(house.category, house.construction_technology, price=5)
+            self.assertEqual([item['id'] for item in self.client.get('/houses/?sort=priceAsc').json()['results'][:2]],
+                             [created.pk, house.pk])
+
+            # Удаление дома в тестовой БД упирается в расхождение миграций PurchasedHouse,
+            # поэтому проверяется обработчик post_delete
+            with self.captureOnCommitCallbacks(execute=True):
+                post_delete.send(sender=House, instance=created, using='default', origin=created)
+            self.assertNotIn(created.pk, index.snapshot[0])
+            self.assertEqual(self.client.get('/houses/?sort=priceAsc').json()['results'][0]['id'], house.pk)
+
+    @override_settings(CATALOG_INDEX_ENABLED=True)
+    def test_catalog_index_follows_discount_changes(self):
+        with mock.patch.object(catalog_index, '_index', CatalogIndex()) as index:
+            self.client.get('/houses/?sort=priceAsc')
+            house = House.objects.order_by('effective_price', 'id').last()
+            with self.captureOnCommitCallbacks(execute=True):
+                house.discount_percentage = 50
+                house.save()
+
+            ids, columns = index.snapshot
+            self.assertEqual(columns['effective_price'][list(ids).index(house.pk)], 500001.5)
+            self.assertEqual(self.client.get('/houses/?sort=priceAsc').json()['results'][0]['id'], house.pk)
+
+    @override_settings(CATALOG_INDEX_ENABLED=True, CATALOG_INDEX_MAX_AGE=300)
+    def test_catalog_index_reloads_changes_from_other_processes_after_max_age(self):
+        FilterOption.objects.create(name='Этажи', field_name='floors', filter_type='exact')
+        house = House.objects.order_by('id').first()
+        with mock.patch.object(catalog_index, '_index', CatalogIndex()) as index:
+            self.assertEqual(self.client.get('/houses/?floors=1').json()['count'], 0)
+
+            # update() не вызывает сигналов — так индекс видит изменения, сделанные другим процессом
+            House.objects.filter(pk=house.pk).update(floors=1)
+            cache.clear()
+            self.assertEqual(self.client.get('/houses/?floors=1').json()['count'], 0)
+
+            cache.clear()
+            with mock.patch('backend.catalog_index.time.monotonic', return_value=index.loaded_at + 301):
+                self.assertEqual(self.client.get('/houses/?floors=1').json()['count'], 1)
+
+
+class ResponseCacheTests(CatalogTestCase):
+    def test_category_detail_cache_depends_on_filters_and_house_changes(self):
+        category = HouseCategory.objects.first()
+        url = f'/houses/categories/{category.slug}/'
+
+        response = self.client.get(url, {'price_max': 900_001, 'page_size': 1})
+        self.assertEqual(response.json()['count'], 2)
+        self.assertEqual(len(response.json()['houses']), 1)
+        self.assertIsNotNone(response.json()['next'])
+
+        response = self.client.get(url, {'sort': 'priceDesc'})
+        self.assertEqual(response.json()['count'], 4)
+        self.assertEqual(response.json()['houses'][0]['price'], '1000003.00')
+
+        with self.assertNumQueries(0):
+            self.client.get(url, {'sort': 'priceDesc'})
+
+        house = category.houses.order_by('price').first()
+        house.price = 2_000_000
+        house.save()
+        response = self.client.get(url, {'sort': 'priceDesc'})
+        self.assertEqual(response.json()['houses'][0]['id'], house.id)
+
+    def test_house_list_pagination_links_use_request_host(self):
+        for query in ('page_size=1', 'pagination=cursor&page_size=1'):
+            self.client.get(f'/houses/?{query}', HTTP_HOST='evil.example')
+            response = self.client.get(f'/houses/?{query}', HTTP_HOST='essense.example')
+            self.assertTrue(response.json()['next'].startswith('http://essense.example/'))
+
+    def test_category_detail_pagination_links_use_request_host(self):
+        category = HouseCategory.objects.first()
+        url = f'/houses/categories/{category.slug}/?page_size=1'
+
+        self.client.get(url, HTTP_HOST='evil.example')
+        response = self.client.get(url, HTTP_HOST='essense.example')
+        self.assertTrue(response.json()['next'].startswith('http://essense.example/'))
+
+    def test_house_save_invalidates_list_and_detail_caches(self):
+        house = House.objects.order_by('price', 'id').first()
+        list_url, detail_url = '/houses/?page_size=12', f'/houses/{house.id}/'
+        self.client.get(list_url)
+        self.client.get(detail_url)
+        with self.assertNumQueries(0):
+            self.client.get(list_url)
+
+        house.title = 'Новое название'
+        house.save()
+
+        self.assertEqual(self.client.get(list_url).json()['results'][0]['title'], 'Новое название')
+        self.assertEqual(self.client.get(detail_url).json()['title'], 'Новое название')
+
+    def test_conditional_get_returns_304_without_queries(self):
+        house = House.objects.first()
+        for url in ('/houses/?page_size=3', f'/houses/{house.id}/', '/houses/category/'):
+            response = self.client.get(url)
+            self.assertTrue(response.has_header('ETag'))
+            self.assertFalse(response.has_header('Last-Modified'))
+
+            with self.assertNumQueries(0):
+                not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(not_modified.status_code, 304)
+
+        etag = self.client.get(f'/houses/{house.id}/')['ETag']
+        house.save()
+        self.assertEqual(self.client.get(f'/houses/{house.id}/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        # Изменение в ту же секунду, что и If-Modified-Since, не даёт ложного 304
+        self.assertEqual(self.client.get(f'/houses/{house.id}/',
+                                         HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 1)).status_code, 200)
+
+    def test_stale_response_is_served_without_etag(self):
+        house = House.objects.order_by('effective_price', 'id').first()
+        urls = {f'/houses/{house.id}/': f"house_detail_{house.id}",
+                '/houses/?page_size=3': make_cache_key('house_list', QueryDict('page_size=3'), host='testserver')}
+        for url in urls:
+            self.client.get(url)
+        house.title = 'Новое название'
+        house.save()
+
+        # Пересборку держит другой воркер, поэтому отдаётся устаревшая запись
+        for url, key in urls.items():
+            cache.add(f"{key}_lock", True)
+            stale = self.client.get(url)
+            self.assertNotIn('Новое название', stale.content.decode())
+            self.assertFalse(stale.has_header('ETag'))
+
+            cache.delete(f"{key}_lock")
+            fresh = self.client.get(url)
+            self.assertIn('Новое название', fresh.content.decode())
+            self.assertTrue(fresh.has_header('ETag'))
+
+    def test_cached_house_detail_is_served_precompressed(self):
+        url = f'/houses/{House.objects.first().id}/'
+        plain = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate, br').content,
+                         brotli.compress(plain.content, quality=9))
+
+        with mock.patch('brotli.compress', side_effect=AssertionError), \
+                mock.patch('gzip.compress', side_effect=AssertionError):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='br;q=0.5, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+    def test_uncached_json_is_compressed_on_the_fly(self):
+        plain = self.client.get('/houses/filter/')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+
+        response = self.client.get('/houses/filter/', HTTP_ACCEPT_ENCODING='br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+
+
+class HouseDetailCacheTests(CatalogTestCase):
+    def test_cached_house_detail_is_served_as_prerendered_json(self):
+        url = f'/houses/{House.objects.first().id}/'
+        first = self.client.get(url)
+
+        with mock.patch.object(HouseSerializer, 'to_representation', side_effect=AssertionError):
+            second = self.client.get(url)
+        self.assertEqual(second['Content-Type'], 'application/json')
+        self.assertEqual(second.content, first.content)
+        self.assertFalse(hasattr(second, 'data'))
+
+    def test_house_detail_hit_and_missing_house_do_not_query_database(self):
+        url = f'/houses/{House.objects.first().id}/'
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        missing_pk = House.objects.order_by('-pk').first().pk + 1
+        self.assertEqual(self.client.get(f'/houses/{missing_pk}/').status_code, 404)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(f'/houses/{missing_pk}/').status_code, 404)
+
+        house = House.objects.first()
+        create_house(house.category, house.construction_technology, pk=missing_pk)
+        self.assertEqual(self.client.get(f'/houses/{missing_pk}/').status_code, 200)
+
+    def test_house_batch_keeps_order_and_shares_detail_cache(self):
+        first, second, third = House.objects.order_by('pk').values_list('pk', flat=True)[:3]
+        self.client.get(f'/houses/{second}/')
+        url = f'/houses/batch/?ids={third},{second},{first}'
+
+        # Промахи читаются одним запросом домов и его prefetch-запросами, несуществующий id пропускается
+        with self.assertNumQueries(4):
+            response = self.client.get(url + ',0')
+        self.assertEqual([house['id'] for house in response.json()], [third, second, first])
+        self.assertEqual(response.json()[1], self.client.get(f'/houses/{second}/').json())
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url + ',0')
+        self.assertEqual([house['id'] for house in response.json()], [third, second, first])
+        self.assertEqual(self.client.get('/houses/batch/?ids=a,b').status_code, 400)
+
+
+class HouseImageTests(CatalogTestCase):
+    def test_house_images_are_split_by_kind_in_position_order(self):
+        house = House.objects.order_by('id').first()
+        extra = Image.objects.create(image='house_images/extra.jpg')
+        house.add_images(HouseImage.INTERIOR, [extra])
+
+        with CaptureQueriesContext(connection) as context:
+            data = HouseSerializer(House.objects.for_listing().get(pk=house.pk)).data
+        self.assertEqual(len([query for query in context.captured_queries if 'backend_houseimage' in query['sql']]), 1)
+        self.assertEqual([image['image'] for image in data['interior_images']],
+                         ['/media/house_images/interior.jpg', '/media/house_images/extra.jpg'])
+        self.assertEqual(len(data['images']), 2)
+        self.assertEqual(len(data['facade_images']), 1)
+
+    def test_category_cover_is_first_image_of_first_house(self):
+        _, response = self.count_queries('/houses/?limit=12')
+        for house in response.json():
+            category = HouseCategory.objects.get(id=house['category_details']['id'])
+            first_house = category.houses.order_by('id').first()
+            self.assertEqual(house['category_details']['random_image_url'],
+                             first_house.images_by_kind[HouseImage.MAIN][0].image.url)
+
+    def test_category_cover_follows_image_changes(self):
+        category = HouseCategory.objects.first()
+        first_house, second_house = category.houses.order_by('id')[:2]
+        cover, second_cover = first_house.images_by_kind[HouseImage.MAIN]
+
+        first_house.remove_images(HouseImage.MAIN, [cover])
+        category.refresh_from_db()
+        self.assertEqual(category.cover_image, second_cover)
+
+        first_house.remove_images(HouseImage.MAIN, [second_cover])
+        category.refresh_from_db()
+        self.assertEqual(category.cover_image, second_house.images_by_kind[HouseImage.MAIN][0])
+
+        first_house.add_images(HouseImage.MAIN, [cover])
+        category.refresh_from_db()
+        self.assertEqual(category.cover_image, cover)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/houses/category/')
+        self.assertEqual({item['random_image_url'] for item in response.json() if item['id'] == category.id},
+                         {cover.image.url})
+
+
+class ImageVariantsTests(CatalogTestCase):
+    def test_image_variants_are_built_in_background_and_exposed_by_width(self):
+        house = House.objects.order_by('id').first()
+        source = io.BytesIO()
+        PILImage.new('RGBA', (1000, 500), (200, 10, 10, 128)).save(source, 'PNG')
+
+        with mock.patch('backend.image_variants.get_executor') as get_executor, \
+                self.captureOnCommitCallbacks(execute=True):
+            image = Image.objects.create(image=SimpleUploadedFile('big.png', source.getvalue()))
+            house.add_images(HouseImage.MAIN, [image])
+        _, storage, name, on_ready = get_executor.return_value.submit.call_args.args
+        self.assertEqual(self.client.get(f'/houses/{house.pk}/').json()['images'][-1]['variants'], {})
+
+        build_variants(storage, name, on_ready)
+        variants = self.client.get(f'/houses/{house.pk}/').json()['images'][-1]['variants']
+        self.assertEqual(list(variants), ['320', '640'])
+        self.assertEqual(set(variants['640']), {'webp', 'jpeg'})
+        with storage.open(Image.objects.get(pk=image.pk).variants['640']['jpeg']) as variant:
+            self.assertEqual(PILImage.open(variant).size, (640, 320))
+
+    def test_finishing_option_and_blog_image_variants_are_exposed(self):
+        house = House.objects.order_by('id').first()
+        option = FinishingOption.objects.get()
+        source = io.BytesIO()
+        PILImage.new('RGB', (800, 400), (10, 120, 10)).save(source, 'JPEG')
+
+        with mock.patch('backend.image_variants.get_executor') as get_executor, \
+                self.captureOnCommitCallbacks(execute=True):
+            option.image = SimpleUploadedFile('wall.jpg', source.getvalue())
+            option.save()
+        _, storage, name, on_ready = get_executor.return_value.submit.call_args.args
+        self.assertEqual(self.client.get(f'/houses/{house.pk}/').json()['finishing_options_details'][0]['image_variants'],
+                         {})
+
+        build_variants(storage, name, on_ready)
+        variants = self.client.get(f'/houses/{house.pk}/').json()['finishing_options_details'][0]['image_variants']
+        self.assertEqual(list(variants), ['320', '640'])
+        self.assertEqual(variants['320']['webp'], storage.url(variant_name(name, 320, 'webp')))
+        self.assertEqual(self.client.get('/houses/finishing-options/').json()[0]['image_variants'], variants)
+
+        # Варианты записи блога читаются из модели, без обращений к хранилищу
+        option.refresh_from_db()
+        with mock.patch('django.core.files.storage.FileSystemStorage.exists', side_effect=AssertionError):
+            blog = Blog(image=name, image_variants=option.image_variants)
+            self.assertEqual(BlogSerializer().get_image_variants(blog), variants)
+
+
+class EffectivePriceTests(CatalogTestCase):
+    def test_price_sort_and_filter_use_effective_price(self):
+        category = HouseCategory.objects.first()
+        house = category.houses.order_by('price').first()
+        self.assertEqual(house.effective_price, Decimal('900000.00'))
+
+        house.discount_percentage = 50
+        house.save(update_fields=['discount_percentage'])
+        house.refresh_from_db()
+        self.assertEqual(house.effective_price, Decimal('500000.00'))
+
+        response = self.client.get(f'/houses/categories/{category.slug}/?sort=priceAsc')
+        self.assertEqual(response.json()['houses'][0]['id'], house.pk)
+        response = self.client.get('/houses/filter/?price_max=600000')
+        self.assertEqual([item['id'] for item in response.json()], [house.pk])
+
+    def test_effective_price_is_computed_by_database_for_bulk_updates(self):
+        house = House.objects.order_by('id').first()
+
+        # 100.01 * 0.5 = 50.005: Python и ROUND() в Postgres округляют половину одинаково
+        House.objects.filter(pk=house.pk).update(price=Decimal('100.01'), discount_percentage=50)
+        house.refresh_from_db()
+        self.assertEqual(house.effective_price, Decimal('50.01'))
+        self.assertEqual(house.calculate_effective_price(), house.effective_price)
+
+        house.price = 2000
+        House.objects.bulk_update([house], ['price'])
+        house.refresh_from_db()
+        self.assertEqual(house.effective_price, Decimal('1000.00'))
+
+        house.discount_percentage = None
+        house.save()
+        self.assertEqual(house.effective_price, Decimal('2000.00'))
+        house.refresh_from_db()
+        self.assertEqual(house.effective_price, Decimal('2000.00'))
+
+
+class HouseCardTests(CatalogTestCase):
+    @override_settings(HOUSE_CARDS_ENABLED=True)
+    def test_house_cards_match_serializer_output_and_read_one_table(self):
+        urls = ('/houses/?page_size=12', '/houses/?view=card&sort=priceDesc&limit=5', '/houses/filter/?price_max=1000001',
+                f'/houses/categories/{HouseCategory.objects.first().slug}/?sort=priceDesc')
+        with override_settings(HOUSE_CARDS_ENABLED=False):
+            expected = [self.client.get(url).json() for url in urls]
+
+        build_house_cards()
+        self.assertEqual(HouseCard.objects.count(), 12)
+        cache.clear()
+        for url, data in zip(urls, expected):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            if url.startswith('/houses/filter/'):
+                # Этот список не сортируется
+                self.assertEqual(sorted(response.json(), key=lambda house: house['id']),
+                                 sorted(data, key=lambda house: house['id']))
+            else:
+                self.assertEqual(response.json(), data)
+            self.assertFalse([query for query in context.captured_queries if '"backend_house"' in query['sql']])
+
+    @override_settings(HOUSE_CARDS_ENABLED=True)
+    def test_house_cards_follow_house_and_relation_changes(self):
+        build_house_cards()
+        house = House.objects.order_by('id').first()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            house.title = 'Новое название'
+            house.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            house.add_images(HouseImage.MAIN, [Image.objects.create(image='house_images/new.jpg')])
+
+        card = HouseCard.objects.get(house=house)
+        self.assertEqual(card.title, 'Новое название')
+        self.assertEqual(card.listing['title'], 'Новое название')
+        self.assertEqual(card.listing['images'][-1]['image'], '/media/house_images/new.jpg')
+
+    @override_settings(HOUSE_CARDS_ENABLED=True)
+    def test_house_cards_are_rebuilt_once_per_transaction(self):
+        house = House.objects.order_by('id').first()
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            # Откат точки сохранения убирает и поставленную в ней пересборку
+            try:
+                with transaction.atomic():
+                    house.save()
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+            house.title = 'Новое название'
+            house.save()
+            house.add_images(HouseImage.MAIN, [Image.objects.create(image=f'house_images/new-{index}.jpg')
+                                               for index in range(3)])
+        self.assertEqual([callback for callback in callbacks if callback is flush_house_cards], [flush_house_cards])
+
+        card = HouseCard.objects.get(house=house)
+        self.assertEqual(card.title, 'Новое название')
+        self.assertEqual(card.listing['images'][-1]['image'], '/media/house_images/new-2.jpg')
+
+
+class CachedResponseMixinTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_reference_list_is_cached_until_its_tag_changes(self):
+        ConstructionTechnology.objects.create(name='Каркас')
+        self.assertEqual(len(self.client.get('/houses/construction-technologies').json()), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.client.get('/houses/construction-technologies').json()), 1)
+
+        ConstructionTechnology.objects.create(name='Брус')
+        self.assertEqual(len(self.client.get('/houses/construction-technologies').json()), 2)
+
+        cache_stats.flush()
+        stats = cache_stats.snapshot()['construction_technologies']
+        self.assertEqual((stats['hit'], stats['miss']), (1, 2))
+
+    def test_permissions_are_checked_before_cache(self):
+        option = FilterOption.objects.create(name='Этажность', field_name='floors', filter_type='exact')
+        url = f'/filter-options/{option.id}/'
+        self.client.force_authenticate(User(id=1, email='admin@example.com'))
+        self.assertEqual(self.client.get(url).json()['field_name'], 'floors')
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+
+class FastJSONTests(SimpleTestCase):
+    data = {
+        'price': Decimal('1000000.50'),
+        'created': datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+        'day': date(2024, 5, 1),
+        'status': gettext_lazy('Одобрено'),
+        'counts': {1: 2},
+        'items': [None, True, 1.5, 'строка\u2028'],
+    }
+
+    def test_renderer_output_matches_drf(self):
+        self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+
+    def test_parser_reads_rendered_json(self):
+        content = FastJSONRenderer().render(self.data)
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(content))['items'], [None, True, 1.5, 'строка\u2028'])
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"price": '))
+
+
+class RespStandInHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.write_lock = threading.Lock()
+        self.protocol = 2
+
+    def handle(self):
+        try:
+            while True:
+                command = self.read_command()
+                if command is None:
+                    break
+                self.execute(command[0].upper(), command[1:])
+        finally:
+            with self.server.lock:
+                for subscribers in self.server.subscribers.values():
+                    subscribers.discard(self)
+
+    def execute(self, name, args):
+        if name == b'PING':
+            self.write(b'+PONG\r\n')
+        elif name == b'HELLO':
+            self.protocol = int(args[0]) if args else 2
+            header = b'%1\r\n' if self.protocol == 3 else b'*2\r\n'
+            self.write(header + self.bulk(b'proto') + b':%d\r\n' % self.protocol)
+        elif name == b'SUBSCRIBE':
+            for channel in args:
+                with self.server.lock:
+                    self.server.subscribers[channel].add(self)
+                self.write(self.push_header() + self.bulk(b'subscribe') + self.bulk(channel) + b':1\r\n')
+        elif name == b'PUBLISH':
+            channel, message = args
+            with self.server.lock:
+                subscribers = list(self.server.subscribers[channel])
+            for subscriber in subscribers:
+                subscriber.write(subscriber.push_header() + self.bulk(b'message') + self.bulk(channel) + self.bulk(message))
+            self.write(b':%d\r\n' % len(subscribers))
+        else:
+            self.write(b'+OK\r\n')
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        parts = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            parts.append(self.rfile.read(length + 2)[:-2])
+        return parts
+
+    def push_header(self):
+        return b'>3\r\n' if self.protocol == 3 else b'*3\r\n'
+
+    @staticmethod
+    def bulk(value):
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+
+    def write(self, data):
+        with self.write_lock:
+            self.wfile.write(data)
+            self.wfile.flush()
+
+
+class RespStandInServer(socketserver.ThreadingTCPServer):
+    """
+    Минимальная замена Redis для тестов рассылки инвалидаций: HELLO, PING, SUBSCRIBE и PUBLISH,
+    на остальные команды отвечает +OK.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), RespStandInHandler)
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)
+
+    @property
+    def url(self):
+        return f"redis://127.0.0.1:{self.server_address[1]}/0"
+
+    def subscriber_count(self, channel):
+        with self.lock:
+            return len(self.subscribers[channel.encode()])
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tiered-default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tiered-l2'},
+})
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.server = RespStandInServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        options = {'BROADCAST_URL': self.server.url, 'L1_TIMEOUT': 60}
+        self.workers = [TieredCache('shared', {'OPTIONS': options}) for _ in range(2)]
+        # Подписка запускается при первом обращении к кэшу; при подключении L1 очищается
+        for worker in self.workers:
+            worker.get('warmup')
+        self.wait_until(lambda: self.server.subscriber_count(self.workers[0].channel) == 2)
+
+    def tearDown(self):
+        for worker in self.workers:
+            worker.close_broadcast()
+        self.server.shutdown()
+        self.server.server_close()
+        caches['shared'].clear()
+
+    def wait_until(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("Условие не выполнилось за 5 секунд")
+            time.sleep(0.01)
+
+    def test_l1_is_served_without_l2(self):
+        first, _ = self.workers
+        first.set('house_detail_1', {'title': 'Дом'})
+        caches['shared'].delete('house_detail_1')
+
+        self.assertEqual(first.get('house_detail_1'), {'title': 'Дом'})
+        self.assertEqual(first.get_many(['house_detail_1', 'house_detail_2']), {'house_detail_1': {'title': 'Дом'}})
+
+    def test_write_in_one_worker_drops_l1_entry_in_other(self):
+        first, second = self.workers
+        first.set('house_detail_1', {'title': 'Старое'})
+        self.assertEqual(second.get('house_detail_1'), {'title': 'Старое'})
+        caches['shared'].set('house_detail_1', {'title': 'Только в L2'})
+        self.assertEqual(second.get('house_detail_1'), {'title': 'Старое'})
+
+        first.set('house_detail_1', {'title': 'Новое'})
+        self.wait_until(lambda: second.get('house_detail_1') == {'title': 'Новое'})
+
+        first.delete('house_detail_1')
+        self.wait_until(lambda: second.get('house_detail_1') is None)
+
+
+
+RESIZE_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=os.path.join(RESIZE_ROOT, 'media'),
+                   MEDIA_RESIZE_CACHE_DIR=os.path.join(RESIZE_ROOT, 'resized'))
+class MediaResizeTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(RESIZE_ROOT, 'media', 'house_images'))
+        PILImage.new('RGB', (1200, 800), 'green').save(os.path.join(RESIZE_ROOT, 'media', 'house_images', 'a.jpg'))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(RESIZE_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        shutil.rmtree(os.path.join(RESIZE_ROOT, 'resized'), ignore_errors=True)
+
+    def test_resized_image_fits_box_and_is_revalidated_by_etag(self):
+        response = self.client.get('/media-resize/300x300/house_images/a.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=600', response['Cache-Control'])
+        self.assertEqual(PILImage.open(io.BytesIO(b''.join(response.streaming_content))).size, (300, 200))
+
+        with mock.patch('backend.media_resize.resize_image', side_effect=AssertionError):
+            self.assertEqual(self.client.get('/media-resize/300x300/house_images/a.jpg').status_code, 200)
+            response = self.client.get('/media-resize/300x300/house_images/a.jpg',
+                                       HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+        self.assertEqual(self.client.get('/media-resize/300x300/house_images/../../outside.jpg').status_code, 404)
+        self.assertEqual(self.client.get('/media-resize/300x300/house_images/missing.jpg').status_code, 404)
+        self.assertEqual(self.client.get('/media-resize/0x300/house_images/a.jpg').status_code, 404)
+
+    def test_replaced_source_gets_new_etag(self):
+        source_path = os.path.join(RESIZE_ROOT, 'media', 'house_images', 'replaced.jpg')
+        PILImage.new('RGB', (1200, 800), 'green').save(source_path)
+        etag = self.client.get('/media-resize/300x300/house_images/replaced.jpg')['ETag']
+
+        PILImage.new('RGB', (800, 1200), 'blue').save(source_path)
+        os.utime(source_path, ns=(time.time_ns() + 10 ** 9,) * 2)
+        response = self.client.get('/media-resize/300x300/house_images/replaced.jpg', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(PILImage.open(io.BytesIO(b''.join(response.streaming_content))).size, (200, 300))
+
+    def test_corrupt_source_is_not_found_and_not_retried(self):
+        source = io.BytesIO()
+        PILImage.new('RGB', (1200, 800), 'green').save(source, 'JPEG')
+        with open(os.path.join(RESIZE_ROOT, 'media', 'house_images', 'truncated.jpg'), 'wb') as truncated:
+            truncated.write(source.getvalue()[:len(source.getvalue()) // 2])
+        with open(os.path.join(RESIZE_ROOT, 'media', 'house_images', 'text.png'), 'wb') as text:
+            text.write(b'not an image')
+
+        for url in ('/media-resize/300x300/house_images/truncated.jpg', '/media-resize/300x300/house_images/text.png'):
+            self.assertEqual(self.client.get(url).status_code, 404)
+            with mock.patch('backend.media_resize.resize_image', side_effect=AssertionError):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_disk_cache_failure_does_not_mark_source_broken(self):
+        url = '/media-resize/300x300/house_images/a.jpg'
+        with mock.patch.object(DiskLRUCache, 'set', side_effect=OSError(28, 'No space left on device')):
+            with self.assertRaises(OSError):
+                self.client.get(url)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_concurrent_requests_run_one_resize(self):
+        calls = []
+
+        def slow_resize(*args):
+            calls.append(args)
+            time.sleep(0.1)
+            return b'resized'
+
+        barrier = threading.Barrier(8)
+
+        def request():
+            barrier.wait()
+            get_resized(os.path.join(RESIZE_ROOT, 'media', 'house_images', 'a.jpg'), 100, 100, 'JPEG', {})
+
+        with mock.patch('backend.media_resize.resize_image', side_effect=slow_resize):
+            workers = [threading.Thread(target=request) for _ in range(8)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        self.assertEqual(len(calls), 1)
+
+    def test_disk_cache_evicts_least_recently_used(self):
+        disk_cache = DiskLRUCache(os.path.join(RESIZE_ROOT, 'resized'), max_bytes=350)
+        for index, key in enumerate(('a', 'b', 'c')):
+            path = disk_cache.set(key, b'x' * 100)
+            os.utime(path, (index, index))
+        self.assertIsNotNone(disk_cache.get('a'))
+
+        disk_cache.set('d', b'x' * 100)
+        self.assertEqual([key for key in 'abcd' if os.path.exists(disk_cache.path(key))], ['a', 'c', 'd'])
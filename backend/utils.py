@@ -1,8 +1,36 @@
+import hashlib
+
 from backend.models import PurchasedHouse
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
 from django.utils import timezone
 from datetime import timedelta
 from collections import defaultdict
 
+
+def normalize_query_params(query_params, exclude=()):
+    """
+    Стабильное представление параметров запроса для ключей кэша:
+    порядок параметров и значений, пустые значения и 'all' не влияют на результат.
+    """
+    items = []
+    for key in sorted(query_params.keys()):
+        if key in exclude:
+            continue
+        values = sorted(value for value in query_params.getlist(key) if value not in ('', 'all'))
+        if values:
+            items.append(f"{key}={','.join(values)}")
+    return '&'.join(items)
+
+
+def make_cache_key(prefix, query_params, exclude=(), host=None):
+    """host передаётся, если в ответе есть абсолютные ссылки с хостом запроса."""
+    normalized = normalize_query_params(query_params, exclude)
+    if host is not None:
+        normalized = f"{host}|{normalized}"
+    return f"{prefix}_{hashlib.md5(normalized.encode('utf-8')).hexdigest()}"
+
+
 def get_period_dates(period):
     today = timezone.now().date()
     if period == '1m':
@@ -44,24 +72,26 @@ def get_projects_data(start_date):
 
 
 def get_budget_data(start_date):
-    purchases = (
+    """План (цена по прайсу) и факт (effective_price) продаж по месяцам, суммы в миллионах."""
+    months = (
         PurchasedHouse.objects
         .filter(purchase_date__gte=start_date)
-        .select_related('house')
+        .annotate(month=TruncMonth('purchase_date'))
+        .values('month')
+        .annotate(plan=Sum('house__price'), actual=Sum('house__effective_price'))
     )
 
     monthly_plan = defaultdict(float)
     monthly_actual = defaultdict(float)
 
-    for p in purchases:
-        month = p.purchase_date.strftime('%b')
-        monthly_plan[month] += round(float(p.house.price) / 1_000_000, 2)
-        actual_price = p.house.new_price or p.house.price
-        monthly_actual[month] += round(float(actual_price) / 1_000_000, 2)
+    for row in months:
+        month = row['month'].strftime('%b')
+        monthly_plan[month] += round(float(row['plan']) / 1_000_000, 2)
+        monthly_actual[month] += round(float(row['actual']) / 1_000_000, 2)
 
     result = [
         {'name': m, 'plan': monthly_plan[m], 'actual': monthly_actual[m]}
         for m in sorted(monthly_plan.keys())
     ]
 
-    return result
\ No newline at end of file
+    return result
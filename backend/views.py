@@ -1,44 +1,63 @@
-import django_filters
+import json
+import time
+from base64 import b64decode, b64encode
+
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q, Count, Min, Max, Prefetch
 from django.http import JsonResponse, Http404
+from django.utils.cache import patch_cache_control
 from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
 from rest_framework import generics, permissions, status
 
 from rest_framework.generics import ListCreateAPIView
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination, BasePagination, _positive_int
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
-from django.core.cache import cache
 
 import openpyxl
 from django.http import HttpResponse
 
 
 from .models import House, ConstructionTechnology, HouseCategory, FinishingOption, Document, Review, Order, \
-    UserQuestionHouse, PurchasedHouse, FilterOption, UserQuestion, Image, Blog, BlogCategory, ReviewFile
+    UserQuestionHouse, PurchasedHouse, FilterOption, UserQuestion, Image, HouseImage, Blog, BlogCategory, ReviewFile
 
 from .serializer import HouseSerializer, ConstructionTechnologySerializer, HouseCategorySerializer, \
     FinishingOptionSerializer, DocumentSerializer, ReviewSerializer, OrderSerializer, \
     PurchasedHouseSerializer, FilterOptionsSerializer, UserQuestionHouseSerializer, UserQuestionSerializer, \
-    BlogSerializer, BlogCategorySerializer
+    BlogSerializer, BlogCategorySerializer, HouseCardSerializer
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
 
-from .utils import get_period_dates, get_projects_data, get_budget_data
+from .cache import get_cached, set_cached, get_tag_versions, house_cache_tags, tags_condition, \
+    cached_json_response, json_response, render_json, cache_stats, CachedResponseMixin, lookup_many, \
+    set_many_cached, cached_entry, Tagged, FRESH, STALE
+from .catalog_index import query_houses, lookup_conditions
+from .filters import get_filter_plan
+from .house_cards import house_cards, supports_lookups, card_ordering, card_payloads
+from .renderers import get_json_renderer
+from .utils import get_period_dates, get_projects_data, get_budget_data, make_cache_key
 
 
-def filter_houses(filters, category=None):
-    houses = House.objects.filter(category=category) if category else House.objects.all()
+def filter_houses(filters, category=None, queryset=None):
+    """queryset — House или HouseCard: у карточек те же имена полей для фильтров."""
+    houses = House.objects.all() if queryset is None else queryset
+    if category:
+        houses = houses.filter(category=category)
 
+    # Цена в фильтре — та, что платит покупатель, с учётом скидки
     if 'price_min' in filters and filters['price_min']:
         min_price = int(filters['price_min'])
-        houses = houses.filter(price__gte=min_price)
+        houses = houses.filter(effective_price__gte=min_price)
 
     if 'price_max' in filters and filters['price_max']:
         max_price = int(filters['price_max'])
-        houses = houses.filter(price__lte=max_price)
+        houses = houses.filter(effective_price__lte=max_price)
 
     if 'bestSeller' in filters and filters.getlist('bestSeller'):
         houses = houses.filter(best_seller__in=filters.getlist('bestSeller'))
@@ -81,10 +100,54 @@ def filter_houses(filters, category=None):
     return houses
 
 
-class DynamicHouseFilter(django_filters.FilterSet):
-    class Meta:
-        model = House
-        fields = {}
+INDEX_RANGE_PARAMS = (
+    ('price_min', 'effective_price__gte'), ('price_max', 'effective_price__lte'),
+    ('area_min', 'area__gte'), ('area_max', 'area__lte'),
+    ('living_area_min', 'living_area__gte'), ('living_area_max', 'living_area__lte'),
+)
+
+INDEX_LIST_PARAMS = (
+    ('floors', 'floors__in'), ('rooms', 'rooms__in'), ('bedrooms', 'bedrooms__in'),
+    ('constructionTechnology', 'construction_technology__in'),
+)
+
+HOUSE_ORDERINGS = {
+    'priceAsc': ('effective_price', 'id'),
+    'priceDesc': ('-effective_price', '-id'),
+}
+
+
+def house_detail_tags(house_id):
+    # Категория дома до чтения из БД неизвестна, поэтому берётся общий тег категорий
+    return (f"house:{house_id}", 'categories', 'house_references')
+
+
+def indexed_filter_houses(filters, category=None, ordering=('id',)):
+    """
+    То же, что filter_houses, но через индекс каталога процесса.
+    Возвращает None, если индекс выключен или фильтр требует SQL (bestSeller, purpose, некорректные числа).
+    """
+    if filters.getlist('bestSeller') or filters.getlist('purpose'):
+        return None
+
+    lookups = {}
+    try:
+        for param, lookup in INDEX_RANGE_PARAMS:
+            if filters.get(param):
+                lookups[lookup] = int(filters[param])
+        for param, lookup in INDEX_LIST_PARAMS:
+            if filters.getlist(param):
+                lookups[lookup] = [int(value) for value in filters.getlist(param)]
+    except ValueError:
+        return None
+
+    if 'garage' in filters:
+        lookups['garage__exact'] = 1 if filters['garage'] == 'Да' else 0
+    if category:
+        lookups['category__exact'] = category.id
+
+    return query_houses(lookup_conditions(lookups), ordering)
+
 
 class Pagination(PageNumberPagination):
     page_size = 6
@@ -96,43 +159,208 @@ class HousePagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+class HouseKeysetPagination(BasePagination):
+    """
+    Курсорная пагинация по составному ключу текущей сортировки (например, price + id).
+    Страница выбирается условием WHERE по ключу вместо OFFSET, без COUNT,
+    поэтому стоимость не зависит от глубины прокрутки.
+    """
+    page_size = 6
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        values, reverse = self.decode_cursor(request, queryset)
+        queryset = self.load_ordering_columns(queryset)
+
+        ordering = [self.invert(field) for field in self.ordering] if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(values, reverse))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = values is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_link(self.page[-1], reverse=False) if self.has_next and self.page else None,
+            'previous': self.get_link(self.page[0], reverse=True) if self.has_previous and self.page else None,
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(request.query_params[self.page_size_query_param], strict=True,
+                                 cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, queryset):
+        ordering = [field for field in queryset.query.order_by if isinstance(field, str)]
+        if not ordering or ordering[-1].lstrip('-') not in ('id', 'pk'):
+            descending = bool(ordering) and ordering[-1].startswith('-')
+            ordering.append('-id' if descending else 'id')
+        return ordering
+
+    def load_ordering_columns(self, queryset):
+        """Колонки сортировки нужны для ссылок курсора, даже если only() из fields их отложил."""
+        loaded, deferred = queryset.query.deferred_loading
+        if deferred or not loaded:
+            return queryset
+        columns = [field.lstrip('-') for field in self.ordering]
+        return queryset.only(*loaded, *[name for name in columns if name not in queryset.query.annotations])
+
+    @staticmethod
+    def get_field(queryset, name):
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        return queryset.model._meta.pk if name == 'pk' else queryset.model._meta.get_field(name)
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    def keyset_filter(self, values, reverse):
+        conditions = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            conditions |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+
+        first = self.ordering[0]
+        lookup = 'lte' if first.startswith('-') != reverse else 'gte'
+        return Q(**{f"{first.lstrip('-')}__{lookup}": values[0]}) & conditions
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(b64decode(encoded.encode('ascii')).decode('utf-8'))
+            values, reverse = cursor['v'], bool(cursor.get('r'))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        # Значения курсора приходят от клиента: приводятся к типам полей сортировки до попадания в WHERE
+        try:
+            values = [self.get_field(queryset, field.lstrip('-')).to_python(value)
+                      for field, value in zip(self.ordering, values)]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in values:
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def get_link(self, house, reverse):
+        values = [str(getattr(house, field.lstrip('-'))) for field in self.ordering]
+        cursor = {'v': values, 'r': 1} if reverse else {'v': values}
+        encoded = b64encode(json.dumps(cursor).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+
 class HouseListView(APIView):
     serializer_class = HouseSerializer
     parser_classes = [MultiPartParser, FormParser]
     pagination_class = HousePagination
+    cursor_pagination_class = HouseKeysetPagination
+    cache_tags = ('catalog',)
+    cache_timeout = 60 * 10
 
+    @tags_condition(lambda request, id=None: house_detail_tags(id) if id is not None else ('catalog',))
     def get(self, request, id=None):
         if id is not None:
             return self.get_house_by_id(id)
 
-        category_slug = request.query_params.get('category')
-        filters = request.query_params
-        sort_by = request.query_params.get('sort', 'priceAsc')
         limit = request.query_params.get('limit')
-        title = request.query_params.get('title')
-
-        houses = self.filter_houses(filters, category_slug, sort_by, title)
-
         if limit:
             try:
                 limit = int(limit)
-                if limit > 0:
-                    houses = houses[:limit]
-                else:
-                    return Response({'detail': 'Параметр limit должен быть положительным числом.'},
-                                    status=status.HTTP_400_BAD_REQUEST)
             except ValueError:
                 return Response({'detail': 'Параметр limit должен быть целым числом.'},
                                 status=status.HTTP_400_BAD_REQUEST)
+            if limit <= 0:
+                return Response({'detail': 'Параметр limit должен быть положительным числом.'},
+                                status=status.HTTP_400_BAD_REQUEST)
 
-        if not limit:
-            paginator = self.pagination_class()
-            paginated_houses = paginator.paginate_queryset(houses, request)
-            serializer = self.serializer_class(paginated_houses, many=True)
-            return paginator.get_paginated_response(serializer.data)
+        # В ответе абсолютные ссылки next/previous, поэтому хост входит в ключ
+        cache_key = make_cache_key('house_list', request.query_params, host=request.get_host())
+        return cached_json_response(request, cache_key, lambda: self.list_houses(request, limit),
+                                    tags=self.cache_tags, timeout=self.cache_timeout, name='house_list')
 
-        serializer = self.serializer_class(houses, many=True)
-        return Response(serializer.data)
+    def list_houses(self, request, limit=None):
+        category_slug = request.query_params.get('category')
+        filters = request.query_params
+        search = request.query_params.get('search')
+        sort_by = request.query_params.get('sort', 'relevance' if search else 'priceAsc')
+        title = request.query_params.get('title')
+        fields = self.get_requested_fields(request)
+
+        houses = None
+        if not title and not search and not self.uses_cursor(request):
+            cards = self.filter_house_cards(filters, sort_by)
+            if cards is not None:
+                return self.list_house_cards(request, cards, limit, fields)
+            houses = self.filter_houses_indexed(filters, sort_by)
+        if houses is None:
+            houses = self.filter_houses(filters, category_slug, sort_by, title, search)
+
+        if request.query_params.get('view') == 'card':
+            serializer_class = HouseCardSerializer
+            houses = houses.for_cards(fields)
+        else:
+            serializer_class = self.serializer_class
+            houses = houses.for_listing(fields)
+
+        if limit:
+            return serializer_class(houses[:limit], many=True, fields=fields).data
+
+        paginator = self.get_paginator(request)
+        paginated_houses = paginator.paginate_queryset(houses, request)
+        serializer = serializer_class(paginated_houses, many=True, fields=fields)
+        return paginator.get_paginated_response(serializer.data).data
+
+    def list_house_cards(self, request, cards, limit=None, fields=None):
+        column = 'card' if request.query_params.get('view') == 'card' else 'listing'
+        payloads = cards.values_list(column, flat=True)
+
+        if limit:
+            return card_payloads(payloads[:limit], fields)
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(payloads, request)
+        return paginator.get_paginated_response(card_payloads(page, fields)).data
+
+    def uses_cursor(self, request):
+        return request.query_params.get('pagination') == 'cursor' or 'cursor' in request.query_params
+
+    def get_paginator(self, request):
+        if self.uses_cursor(request):
+            return self.cursor_pagination_class()
+        return self.pagination_class()
+
+    def get_requested_fields(self, request):
+        fields = request.query_params.get('fields')
+        if not fields:
+            return None
+        return [name.strip() for name in fields.split(',') if name.strip()]
 
     def post(self, request):
         serializer = self.serializer_class(data=request.data)
@@ -145,13 +373,13 @@ class HouseListView(APIView):
 
     def get_house_by_id(self, id):
         try:
-            house = House.objects.get(id=id)
+            house = House.objects.for_listing().get(id=id)
             serializer = self.serializer_class(house)
             return Response(serializer.data)
         except House.DoesNotExist:
             return Response({'detail': 'Дом не найден.'}, status=status.HTTP_404_NOT_FOUND)
 
-    def filter_houses(self, filters, category_name=None, sort_by='priceAsc', title=None):
+    def filter_houses(self, filters, category_name=None, sort_by='priceAsc', title=None, search=None):
         filters = filters.copy()
         filters = dict(filters)
         filters = {k: v[0] if isinstance(v, list) and len(v) == 1 else v for k, v in filters.items()}
@@ -170,53 +398,179 @@ class HouseListView(APIView):
         if title:
             houses = houses.filter(title__icontains=title)
 
+        if search:
+            houses = houses.search(search)
+
         filtered_houses = self.create_dynamic_filter(filters, houses)
 
         if sort_by == 'priceAsc':
-            filtered_houses = filtered_houses.order_by('price')
+            filtered_houses = filtered_houses.order_by(*HOUSE_ORDERINGS['priceAsc'])
         elif sort_by == 'priceDesc':
-            filtered_houses = filtered_houses.order_by('-price')
+            filtered_houses = filtered_houses.order_by(*HOUSE_ORDERINGS['priceDesc'])
+        elif sort_by == 'relevance' and search:
+            filtered_houses = filtered_houses.order_by('-rank', 'id')
 
         return filtered_houses
 
+    def filter_house_cards(self, filters, sort_by='priceAsc'):
+        """
+        Отбор и сортировка filter_houses по таблице карточек HouseCard.
+        Возвращает None, если карточки выключены или фильтр затрагивает поля вне карточки.
+        """
+        cards = house_cards()
+        if cards is None:
+            return None
+
+        filters = dict(filters.copy())
+        filters = {k: v[0] if isinstance(v, list) and len(v) == 1 else v for k, v in filters.items()}
+
+        if 'category' in filters and filters['category']:
+            category_name = filters.pop('category').replace('+', ' ')
+            if category_name != 'all':
+                category = HouseCategory.objects.filter(name__iexact=category_name).first()
+                if category is None:
+                    return cards.none()
+                cards = cards.filter(category=category)
+
+        lookups = get_filter_plan().cleaned_lookups(filters)
+        if not supports_lookups(lookups):
+            return None
+        cards = cards.filter(**lookups)
+        if sort_by in HOUSE_ORDERINGS:
+            cards = cards.order_by(*card_ordering(HOUSE_ORDERINGS[sort_by]))
+        return cards
+
+    def filter_houses_indexed(self, filters, sort_by='priceAsc'):
+        """
+        Отбор и сортировка filter_houses по индексу каталога процесса; из БД читается только страница.
+        Возвращает None, если индекс выключен или фильтр ему не по силам.
+        """
+        filters = dict(filters.copy())
+        filters = {k: v[0] if isinstance(v, list) and len(v) == 1 else v for k, v in filters.items()}
+
+        category = None
+        if 'category' in filters and filters['category']:
+            category_name = filters.pop('category').replace('+', ' ')
+            if category_name != 'all':
+                category = HouseCategory.objects.filter(name__iexact=category_name).first()
+                if category is None:
+                    return None
+
+        conditions = lookup_conditions(get_filter_plan().cleaned_lookups(filters))
+        if conditions is not None and category is not None:
+            conditions.append(('category_id', 'exact', category.id))
+        return query_houses(conditions, HOUSE_ORDERINGS.get(sort_by, ('id',)))
+
     def create_dynamic_filter(self, filters, queryset):
-        filters_db = FilterOption.objects.all()
-        filter_dict = {}
+        return get_filter_plan().apply(filters, queryset)
+
 
-        cleaned_filters = {
-            k: v for k, v in filters.items()
-            if v not in ['all', '', None]
+class HouseFacetsView(HouseListView):
+    """
+    Количество домов по значениям фильтров и диапазоны числовых полей
+    для текущего набора фильтров каталога.
+    """
+    http_method_names = ['get', 'head', 'options']
+    facet_fields = ('floors', 'rooms', 'bedrooms', 'purpose')
+    range_fields = ('price', 'effective_price', 'area', 'living_area')
+    ignored_params = ('sort', 'page', 'page_size', 'limit', 'cursor', 'pagination', 'view', 'fields')
+    cache_timeout = 60 * 5
+
+    def get(self, request):
+        cache_key = make_cache_key('house_facets', request.query_params, exclude=self.ignored_params)
+        return cached_json_response(request, cache_key, lambda: self.get_facets(self.filter_houses(
+            request.query_params, title=request.query_params.get('title'),
+            search=request.query_params.get('search')).order_by()),
+            tags=self.cache_tags, timeout=self.cache_timeout, name='house_facets')
+
+    def get_facets(self, houses):
+        aggregates = {'count': Count('id')}
+        for field in self.range_fields:
+            aggregates[f'{field}_min'] = Min(field)
+            aggregates[f'{field}_max'] = Max(field)
+        for value, _ in House.BESTSELLER_CHOICES:
+            aggregates[f'best_seller_{value}'] = Count('id', filter=Q(best_seller=value))
+        totals = houses.aggregate(**aggregates)
+
+        facets = {
+            field: [
+                {'value': row[field], 'count': row['count']}
+                for row in houses.values(field).annotate(count=Count('id')).order_by(field)
+            ]
+            for field in self.facet_fields
+        }
+        facets['construction_technology'] = [
+            {'value': row['construction_technology'], 'name': row['construction_technology__name'],
+             'count': row['count']}
+            for row in houses.values('construction_technology', 'construction_technology__name')
+            .annotate(count=Count('id')).order_by('construction_technology__name')
+        ]
+        facets['best_seller'] = [
+            {'value': value, 'count': totals[f'best_seller_{value}']}
+            for value, _ in House.BESTSELLER_CHOICES
+        ]
+
+        return {
+            'count': totals['count'],
+            'facets': facets,
+            'ranges': {
+                field: {'min': totals[f'{field}_min'], 'max': totals[f'{field}_max']}
+                for field in self.range_fields
+            },
         }
 
-        for filter_option in filters_db:
-            if filter_option.filter_type == 'exact':
-                filter_dict[filter_option.field_name] = django_filters.CharFilter(field_name=filter_option.field_name)
-            elif filter_option.filter_type == 'range':
-                filter_dict[filter_option.field_name + '__gte'] = django_filters.NumberFilter(
-                    field_name=filter_option.field_name, lookup_expr='gte')
-                filter_dict[filter_option.field_name + '__lte'] = django_filters.NumberFilter(
-                    field_name=filter_option.field_name, lookup_expr='lte')
-            elif filter_option.filter_type == 'contains':
-                filter_dict[filter_option.field_name] = django_filters.CharFilter(
-                    field_name=filter_option.field_name, lookup_expr='icontains')
 
-        house_filter = DynamicHouseFilter(cleaned_filters, queryset=queryset)
-        house_filter.filters.update(filter_dict)
+class HouseSuggestView(APIView):
+    """
+    Подсказки для строки поиска: только id, название и цена лучших совпадений.
+    Поиск по подстроке читает GIN-индекс house_title_upper_trgm_idx, по сходству триграмм — house_title_trgm_idx.
+    """
+    default_limit = 8
+    max_limit = 20
+    min_query_length = 2
+    cache_max_age = 60
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+
+        if len(query) < self.min_query_length:
+            response = Response([])
+        else:
+            response = Response(list(self.get_queryset(query)[:self.get_limit(request)]))
+
+        patch_cache_control(response, public=True, max_age=self.cache_max_age)
+        return response
+
+    def get_queryset(self, query):
+        return (
+            House.objects
+            .filter(Q(title__icontains=query) | Q(title__trigram_word_similar=query))
+            .annotate(similarity=TrigramWordSimilarity(query, 'title'))
+            .order_by('-similarity', 'title', 'id')
+            .values('id', 'title', 'price', 'effective_price')
+        )
+
+    def get_limit(self, request):
+        try:
+            return _positive_int(request.query_params['limit'], strict=True, cutoff=self.max_limit)
+        except (KeyError, ValueError):
+            return self.default_limit
+
+
+HOUSE_DETAIL_TIMEOUT = 60 * 10
+# Запись «дома нет» живёт недолго: создание дома с этим pk и так сбрасывает её через тег house:{pk}
+HOUSE_NOT_FOUND_TIMEOUT = 60
 
-        return house_filter.qs
+
+def build_house_detail(pk):
+    house = House.objects.for_listing().filter(pk=pk).first()
+    if house is None:
+        return Tagged(None, (f"house:{pk}",), HOUSE_NOT_FOUND_TIMEOUT)
+    return Tagged(render_json(HouseSerializer(house).data), house_cache_tags(house), HOUSE_DETAIL_TIMEOUT)
 
 
 class HouseDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = House.objects.prefetch_related(
-        'category',
-        'construction_technology',
-        'images',
-        'interior_images',
-        'facade_images',
-        'layout_images',
-        'finishing_options',
-        'documents'
-    ).all()
+    queryset = House.objects.for_listing()
     serializer_class = HouseSerializer
 
     def get_permissions(self):
@@ -224,34 +578,80 @@ class HouseDetailView(generics.RetrieveUpdateDestroyAPIView):
             return [IsAuthenticated()]
         return [AllowAny()]
 
-    def get(self, request, *args, **kwargs):
-        house = self.get_object()
-
-        cache_key = f"house_detail_{house.id}"
-        cached_data = cache.get(cache_key)
-
-        if cached_data:
-            return Response(cached_data)
-
-        house_data = HouseSerializer(house).data
+    @tags_condition(lambda request, pk: house_detail_tags(pk))
+    def get(self, request, pk):
+        # Кэш проверяется по pk до запроса к БД; отсутствующий дом тоже кэшируется, как None
+        rendered, state = cached_entry(f"house_detail_{pk}", lambda: build_house_detail(pk),
+                                       tags=(f"house:{pk}", 'house_references'), timeout=HOUSE_DETAIL_TIMEOUT,
+                                       name='house_detail')
+        if rendered is None:
+            raise Http404
+        response = json_response(request, rendered)
+        response.served_stale = state == STALE
+        return response
 
-        cache.set(cache_key, house_data, timeout=60 * 10)
 
-        return Response(house_data)
+def batch_house_ids(request):
+    """id домов из ?ids=1,2,3 в порядке запроса без повторов или None, если список некорректен."""
+    try:
+        ids = [int(value) for value in request.query_params.get('ids', '').split(',') if value.strip()]
+    except ValueError:
+        return None
+    return list(dict.fromkeys(ids))
 
-    def perform_update(self, serializer):
-        super().perform_update(serializer)
-        self.clear_cache()
 
-    def perform_destroy(self, instance):
-        house_id = instance.id
-        cache_key = f"house_detail_{house_id}"
-        cache.delete(cache_key)
-        super().perform_destroy(instance)
+class HouseBatchView(APIView):
+    """
+    Несколько домов одним запросом для сравнения и избранного: /houses/batch/?ids=1,2,3.
+    Данные берутся из тех же записей house_detail_{id}, что и у HouseDetailView:
+    все записи читаются одним get_many, промахи — одним запросом к БД и сохраняются одним set_many.
+    Дома отдаются в порядке ids, несуществующие пропускаются.
+    """
+    permission_classes = [AllowAny]
+    max_ids = 50
 
-    def clear_cache(self):
-        cache_key = f"house_detail_{self.get_object().id}"
-        cache.delete(cache_key)
+    @tags_condition(lambda request: [tag for pk in batch_house_ids(request) or () for tag in house_detail_tags(pk)])
+    def get(self, request):
+        ids = batch_house_ids(request)
+        if not ids:
+            return Response({'detail': 'Параметр ids должен быть списком id через запятую.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > self.max_ids:
+            return Response({'detail': f'Можно запросить не больше {self.max_ids} домов.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        keys = {pk: f"house_detail_{pk}" for pk in ids}
+        found = lookup_many(list(keys.values()))
+        rendered = {pk: found[key][0] for pk, key in keys.items() if found.get(key, (None, None))[1] == FRESH}
+        for _ in rendered:
+            cache_stats.record('house_detail', 'hit')
+
+        misses = [pk for pk in ids if pk not in rendered]
+        if misses:
+            rendered.update(self.load_houses(misses))
+
+        # Записи кэша уже отрендерены, поэтому ответ склеивается из готовых байтов;
+        # None — закэшированное «дома нет»
+        content = b'[' + b','.join(rendered[pk][0] for pk in ids if rendered[pk] is not None) + b']'
+        return json_response(request, (content, get_json_renderer().media_type, {}))
+
+    def load_houses(self, ids):
+        for _ in ids:
+            cache_stats.record('house_detail', 'miss')
+        versions = get_tag_versions([*(f"house:{pk}" for pk in ids), 'house_references'])
+        started = time.monotonic()
+        houses = list(House.objects.for_listing().filter(pk__in=ids))
+        rendered = {house.pk: render_json(HouseSerializer(house).data) for house in houses}
+        delta = time.monotonic() - started
+
+        if houses:
+            set_many_cached({f"house_detail_{house.pk}": (rendered[house.pk], house_cache_tags(house))
+                             for house in houses}, HOUSE_DETAIL_TIMEOUT, versions, delta)
+        not_found = [pk for pk in ids if pk not in rendered]
+        if not_found:
+            set_many_cached({f"house_detail_{pk}": (None, (f"house:{pk}",)) for pk in not_found},
+                            HOUSE_NOT_FOUND_TIMEOUT, versions, delta)
+        return {pk: rendered.get(pk) for pk in ids}
 
 
 class FilteredHouseListView(APIView):
@@ -260,163 +660,138 @@ class FilteredHouseListView(APIView):
     def get(self, request):
         filters = request.query_params
 
-        houses = filter_houses(filters)
-        serializer = self.serializer_class(houses, many=True)
+        cards = house_cards()
+        if cards is not None:
+            return Response(card_payloads(filter_houses(filters, queryset=cards).values_list('listing', flat=True)))
+
+        houses = indexed_filter_houses(filters)
+        if houses is None:
+            houses = filter_houses(filters)
+        serializer = self.serializer_class(houses.for_listing(), many=True)
         return Response(serializer.data)
 
 
 
-class ConstructionTechnologyListView(generics.ListCreateAPIView):
+class ConstructionTechnologyListView(CachedResponseMixin, generics.ListCreateAPIView):
     queryset = ConstructionTechnology.objects.all()
     serializer_class = ConstructionTechnologySerializer
-
-    def get_queryset(self):
-        options = cache.get('construction_technologies')
-        if not options:
-            options = super().get_queryset()
-            cache.set('construction_technologies', options, timeout=60 * 60)
-        return options
+    cache_name = 'construction_technologies'
+    cache_tags = ('house_references',)
+    cache_key_params = ()
 
 
-class ConstructionTechnologyDetailView(generics.RetrieveUpdateDestroyAPIView):
+class ConstructionTechnologyDetailView(CachedResponseMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = ConstructionTechnology.objects.all()
     serializer_class = ConstructionTechnologySerializer
+    cache_name = 'construction_technology'
+    cache_tags = ('house_references',)
+    cache_key_params = ()
 
 
 
 
-class HouseCategoryListView(generics.ListCreateAPIView):
-    queryset = HouseCategory.objects.prefetch_related('houses')
+class HouseCategoryListView(CachedResponseMixin, generics.ListCreateAPIView):
+    queryset = HouseCategory.objects.select_related('cover_image')
     serializer_class = HouseCategorySerializer
-
-    def get(self, request, *args, **kwargs):
-        cache_key = "house_category_list"
-        cached_data = cache.get(cache_key)
-
-        if cached_data:
-            return Response(cached_data)
-
-
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        data = serializer.data
-
-        cache.set(cache_key, data, timeout=60 * 60)
-        return Response(data)
-
-    def perform_create(self, serializer):
-        response = super().perform_create(serializer)
-        cache.delete("house_category_list")
-        return response
+    cache_name = 'house_category_list'
+    cache_tags = ('categories',)
+    cache_key_params = ()
 
 
 class HouseCategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = HouseCategory.objects.all()
+    queryset = HouseCategory.objects.select_related('cover_image')
     serializer_class = HouseCategorySerializer
+    pagination_class = HousePagination
     lookup_field = 'slug'
 
     def get(self, request, *args, **kwargs):
         category_slug = self.kwargs['slug']
-        cache_key = f"house_category_{category_slug}"
-        cached_data = cache.get(cache_key)
-
-        if cached_data:
-            return Response(cached_data)
-
-        category = get_object_or_404(HouseCategory, slug=category_slug)
+        # В ответе абсолютные ссылки next/previous, поэтому хост входит в ключ
+        cache_key = make_cache_key(f"house_category_{category_slug}", request.query_params,
+                                   host=request.get_host())
+        # Теги записи (category:{id}) хранятся в ней самой, поэтому id категории до чтения кэша не нужен
+        rendered = get_cached(cache_key)
+
+        if rendered:
+            cache_stats.record('house_category_detail', 'hit')
+            return json_response(request, rendered)
+
+        cache_stats.record('house_category_detail', 'miss')
+        category = get_object_or_404(self.get_queryset(), slug=category_slug)
+        tags = (f"category:{category.id}", 'house_references')
+        versions = get_tag_versions(tags)
         filters = request.query_params
-        houses = filter_houses(filters, category=category)
+        ordering = HOUSE_ORDERINGS.get(filters.get('sort'), HOUSE_ORDERINGS['priceAsc'])
+        paginator = self.pagination_class()
+
+        cards = house_cards()
+        if cards is not None:
+            cards = filter_houses(filters, category=category, queryset=cards).order_by(*card_ordering(ordering))
+            houses_data = card_payloads(paginator.paginate_queryset(cards.values_list('listing', flat=True),
+                                                                    request, view=self))
+        else:
+            houses = indexed_filter_houses(filters, category=category, ordering=ordering)
+            if houses is None:
+                houses = filter_houses(filters, category=category).order_by(*ordering)
+            page = paginator.paginate_queryset(houses.for_listing(), request, view=self)
+            houses_data = HouseSerializer(page, many=True).data
 
         category_serializer = self.get_serializer(category)
-        houses_serializer = HouseSerializer(houses, many=True)
 
         response_data = {
             "category": category_serializer.data,
-            "houses": houses_serializer.data,
+            "houses": houses_data,
+            "count": paginator.page.paginator.count,
+            "next": paginator.get_next_link(),
+            "previous": paginator.get_previous_link(),
         }
 
-        cache.set(cache_key, response_data, timeout=60 * 60)
-        return Response(response_data)
-
-    def perform_update(self, serializer):
-        response = super().perform_update(serializer)
-        cache.delete(f"house_category_{self.kwargs['slug']}")
-        cache.delete("house_category_list")
-        return response
-
-    def perform_destroy(self, instance):
-        cache.delete(f"house_category_{instance.slug}")
-        cache.delete("house_category_list")
-        super().perform_destroy(instance)
+        rendered = render_json(response_data)
+        set_cached(cache_key, rendered, tags, timeout=60 * 60, versions=versions)
+        return json_response(request, rendered)
 
 
 class HouseCategoryDetailByIdView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = HouseCategory.objects.all()
+    queryset = HouseCategory.objects.select_related('cover_image')
     serializer_class = HouseCategorySerializer
     permission_classes = [IsAuthenticated]
 
 
-class FinishingOptionListView(generics.ListCreateAPIView):
+class FinishingOptionListView(CachedResponseMixin, generics.ListCreateAPIView):
     queryset = FinishingOption.objects.all()
     serializer_class = FinishingOptionSerializer
-    #
-    # def get(self, request, *args, **kwargs):
-    #     cache_key = "finishing_options_list"
-    #     cached_data = cache.get(cache_key)
-    #
-    #     if cached_data:
-    #         return Response(cached_data)
-    #
-    #     queryset = self.get_queryset()
-    #     serializer = self.get_serializer(queryset, many=True)
-    #     data = serializer.data
-    #
-    #     cache.set(cache_key, data, timeout=60 * 60)
-    #     return Response(data)
-    #
-    # def perform_create(self, serializer):
-    #     response = super().perform_create(serializer)
-    #     cache.delete("finishing_options_list")  # Очищаем кэш списка
-    #     return response
-
-class FinishingOptionDetailView(generics.RetrieveUpdateDestroyAPIView):
+    cache_name = 'finishing_options'
+    cache_tags = ('house_references',)
+    cache_key_params = ()
+    cache_vary_on_host = True
+
+
+class FinishingOptionDetailView(CachedResponseMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = FinishingOption.objects.all()
     serializer_class = FinishingOptionSerializer
     permission_classes = [IsAuthenticated]
+    cache_name = 'finishing_option'
+    cache_tags = ('house_references',)
+    cache_key_params = ()
+    cache_vary_on_host = True
 
-    # def get(self, request, *args, **kwargs):
-    #     finishing_option = self.get_object()
-    #     cache_key = f"finishing_option_{finishing_option.id}"
-    #     cached_data = cache.get(cache_key)
-    #
-    #     if cached_data:
-    #         return Response(cached_data)
-    #
-    #     serializer = self.get_serializer(finishing_option)
-    #     data = serializer.data
-    #
-    #     cache.set(cache_key, data, timeout=60 * 60)
-    #     return Response(data)
-    #
-    # def perform_update(self, serializer):
-    #     response = super().perform_update(serializer)
-    #     cache.delete(f"finishing_option_{self.get_object().id}")
-    #     cache.delete("finishing_options_list")
-    #     return response
-    #
-    # def perform_destroy(self, instance):
-    #     cache.delete(f"finishing_option_{instance.id}")
-    #     cache.delete("finishing_options_list")
-    #     super().perform_destroy(instance)
-
-class DocumentListView(generics.ListCreateAPIView):
+
+class DocumentListView(CachedResponseMixin, generics.ListCreateAPIView):
     queryset = Document.objects.all()
     serializer_class = DocumentSerializer
+    cache_name = 'documents'
+    cache_tags = ('house_references',)
+    cache_key_params = ()
+    cache_vary_on_host = True
 
 
-class DocumentDetailView(generics.RetrieveUpdateDestroyAPIView):
+class DocumentDetailView(CachedResponseMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Document.objects.all()
     serializer_class = DocumentSerializer
+    cache_name = 'document'
+    cache_tags = ('house_references',)
+    cache_key_params = ()
+    cache_vary_on_host = True
 
 
 
@@ -633,10 +1008,7 @@ class PurchaseHouseListView(generics.ListCreateAPIView):
         construction_status = self.request.query_params.get('construction_status', None)
 
         queryset = PurchasedHouse.objects.select_related('house').prefetch_related(
-            'house__images',
-            'house__interior_images',
-            'house__facade_images',
-            'house__layout_images',
+            Prefetch('house__house_images', queryset=HouseImage.objects.select_related('image')),
             'house__category',
             'house__construction_technology',
             'house__documents',
@@ -684,70 +1056,55 @@ class PurchaseHouseDetailView(generics.RetrieveUpdateDestroyAPIView):
     def get(self, request, *args, **kwargs):
         house_id = self.kwargs['pk']
         cache_key = f"purchase_house_{house_id}"
-        cached_data = cache.get(cache_key)
-
-        if cached_data:
-            return Response(cached_data)
+        rendered = get_cached(cache_key)
 
-        house = self.get_object()
-        serializer = self.get_serializer(house)
-        data = serializer.data
+        if rendered:
+            cache_stats.record('purchase_house_detail', 'hit')
+            return json_response(request, rendered)
 
-        cache.set(cache_key, data, timeout=60 * 60)
-        return Response(data)
+        cache_stats.record('purchase_house_detail', 'miss')
+        purchase = self.get_object()
+        tags = (f"purchase:{purchase.pk}", *house_cache_tags(purchase.house))
+        versions = get_tag_versions(tags)
+        serializer = self.get_serializer(purchase)
+        rendered = render_json(serializer.data)
 
-    def perform_update(self, serializer):
-        response = super().perform_update(serializer)
-        cache.delete(f"purchase_house_{self.kwargs['pk']}")
-        cache.delete("purchase_house_list")
-        return response
-
-    def perform_destroy(self, instance):
-        cache.delete(f"purchase_house_{instance.pk}")
-        cache.delete("purchase_house_list")
-        super().perform_destroy(instance)
+        set_cached(cache_key, rendered, tags, timeout=60 * 60, versions=versions)
+        return json_response(request, rendered)
 
 
 
-class FilterOptionListView(generics.ListCreateAPIView):
+class FilterOptionListView(CachedResponseMixin, generics.ListCreateAPIView):
     queryset = FilterOption.objects.all()
     serializer_class = FilterOptionsSerializer
+    cache_name = 'filter_options'
+    cache_tags = ('filter_options',)
+    cache_key_params = ()
 
 
-class FilterOptionDetailView(generics.RetrieveUpdateDestroyAPIView):
+class FilterOptionDetailView(CachedResponseMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = FilterOption.objects.all()
     serializer_class = FilterOptionsSerializer
     permission_classes = [IsAuthenticated]
+    cache_name = 'filter_option'
+    cache_tags = ('filter_options',)
+    cache_key_params = ()
 
 
 class CreateHouseAPIView(APIView):
     permission_classes = [IsAuthenticated]
     parser_classes = (MultiPartParser, FormParser)
 
+    @method_decorator(transaction.atomic)
     def post(self, request, format=None):
         serializer = HouseSerializer(data=request.data)
         if serializer.is_valid():
             house = serializer.save()
 
-            for file in request.FILES.getlist('images'):
-                img = Image(image=file)
-                img.save()
-                house.images.add(img)
-
-            for file in request.FILES.getlist('interior_images'):
-                img = Image(image=file)
-                img.save()
-                house.interior_images.add(img)
-
-            for file in request.FILES.getlist('facade_images'):
-                img = Image(image=file)
-                img.save()
-                house.facade_images.add(img)
-
-            for file in request.FILES.getlist('layout_images'):
-                img = Image(image=file)
-                img.save()
-                house.layout_images.add(img)
+            for field, kind in HouseImage.FIELD_KINDS.items():
+                files = request.FILES.getlist(field)
+                if files:
+                    house.add_images(kind, [Image.objects.create(image=file) for file in files])
 
             for file in request.FILES.getlist('documents'):
                 document = Document(file=file)
@@ -762,6 +1119,7 @@ class UpdateHouseAPIView(APIView):
     permission_classes = [IsAuthenticated]
     parser_classes = (MultiPartParser, FormParser)
 
+    @method_decorator(transaction.atomic)
     def patch(self, request, house_id, format=None):
         try:
             house = House.objects.get(id=house_id)
@@ -776,31 +1134,15 @@ class UpdateHouseAPIView(APIView):
                 remove_images = request.data.getlist('remove_images')
                 for image_id in remove_images:
                     try:
-                        image = Image.objects.get(id=image_id)
-                        house.images.remove(image)
-                        image.delete()
+                        # Связи с домом любого вида удаляются каскадом
+                        Image.objects.get(id=image_id).delete()
                     except Image.DoesNotExist:
                         continue
 
-            for file in request.FILES.getlist('images'):
-                img = Image(image=file)
-                img.save()
-                house.images.add(img)
-
-            for file in request.FILES.getlist('interior_images'):
-                img = Image(image=file)
-                img.save()
-                house.interior_images.add(img)
-
-            for file in request.FILES.getlist('facade_images'):
-                img = Image(image=file)
-                img.save()
-                house.facade_images.add(img)
-
-            for file in request.FILES.getlist('layout_images'):
-                img = Image(image=file)
-                img.save()
-                house.layout_images.add(img)
+            for field, kind in HouseImage.FIELD_KINDS.items():
+                files = request.FILES.getlist(field)
+                if files:
+                    house.add_images(kind, [Image.objects.create(image=file) for file in files])
 
             if 'remove_documents' in request.data:
                 remove_documents = request.data.getlist('remove_documents')
@@ -829,23 +1171,11 @@ class DeleteImageView(APIView):
         image = get_object_or_404(Image, id=image_id)
 
 
-        if category == 'images':
-            if image in house.images.all():
-                house.images.remove(image)
-        elif category == 'interior_images':
-            if image in house.interior_images.all():
-                house.interior_images.remove(image)
-        elif category == 'facade_images':
-            if image in house.facade_images.all():
-                house.facade_images.remove(image)
-        elif category == 'layout_images':
-            if image in house.layout_images.all():
-                house.layout_images.remove(image)
-        else:
+        if category not in HouseImage.FIELD_KINDS:
             return JsonResponse({'status': 'error', 'message': 'Неправильная категория изображения'}, status=400)
 
-
-        if image.houses.count() == 0:
+        house.remove_images(HouseImage.FIELD_KINDS[category], [image])
+        if not image.house_images.exists():
             image.delete()
 
         return JsonResponse({'status': 'success', 'message': 'Картинка успешно удалена'})
@@ -999,11 +1329,14 @@ def export_user_questions_and_houses(request):
     wb.save(response)
     return response
 
-class BlogListCreateView(generics.ListCreateAPIView):
+class BlogListCreateView(CachedResponseMixin, generics.ListCreateAPIView):
     queryset = Blog.objects.select_related('category').all().order_by('-date')
     serializer_class = BlogSerializer
     parser_classes = [MultiPartParser, FormParser]
     pagination_class = Pagination
+    cache_name = 'blog_list'
+    cache_tags = ('blog',)
+    cache_vary_on_host = True
 
     def get_permissions(self):
         if self.request.method == 'POST':
@@ -1026,17 +1359,20 @@ class BlogListCreateView(generics.ListCreateAPIView):
         return queryset
 
 
-class BlogDetailView(generics.RetrieveUpdateDestroyAPIView):
+class BlogDetailView(CachedResponseMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Blog.objects.all()
     serializer_class = BlogSerializer
     parser_classes = [MultiPartParser, FormParser]
+    cache_name = 'blog_detail'
+    cache_tags = ('blog',)
+    cache_key_params = ()
+    cache_vary_on_host = True
 
     def get_permissions(self):
         if self.request.method in ['DELETE', 'PUT', 'PATCH']:
             return [IsAuthenticated()]
         return [AllowAny()]
 
-
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', True)
         instance = self.get_object()
@@ -1045,9 +1381,12 @@ class BlogDetailView(generics.RetrieveUpdateDestroyAPIView):
         self.perform_update(serializer)
         return Response(serializer.data)
 
-class BlogCategoryListView(generics.ListCreateAPIView):
+class BlogCategoryListView(CachedResponseMixin, generics.ListCreateAPIView):
     queryset = BlogCategory.objects.all()
     serializer_class = BlogCategorySerializer
+    cache_name = 'blog_categories'
+    cache_tags = ('blog',)
+    cache_key_params = ()
 
 class BlogsByCategoryView(generics.ListAPIView):
     serializer_class = BlogSerializer